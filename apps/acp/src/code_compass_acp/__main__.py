@@ -6,10 +6,22 @@ import acp
 
 from .agent import CodeCompassAgent
 
+try:
+    import uvloop
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    uvloop = None
+
 
 def main() -> None:
     agent = CodeCompassAgent()
-    asyncio.run(acp.run_agent(agent))
+    # uvloop (extra `fast-loop`) acelera o I/O de stdio do ACP e do MCP; sem ele, loop padrão.
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        try:
+            runner.run(acp.run_agent(agent))
+        finally:
+            # Fecha os bridges MCP ainda no loop dono dos subprocessos; o atexit é só fallback.
+            runner.run(agent.aclose())
 
 
 if __name__ == "__main__":
@@ -2,23 +2,30 @@ from __future__ import annotations
 
 import asyncio
 import atexit
-import json
+import contextlib
+import functools
+import itertools
 import os
 import signal
 import sys
+import time
 import tomllib
+import weakref
+from collections.abc import AsyncIterator, Awaitable, Callable
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from secrets import token_hex
+from typing import Any, Final
 
 import acp
 from acp import schema as acp_schema
 from acp.helpers import update_available_commands
 
+from . import json_codec
 from .adk_agent_builder import build_runtime_adapter
 from .adk_runtime import LegacyRuntimeAdapter
 from .bridge import McpBridge, build_bridge
-from .chunker import chunk_by_paragraph
+from .chunker import iter_paragraph_chunks
 from .memory.local_memory_qdrant_index import LocalMemoryQdrantIndex
 from .memory.local_session_store import LocalSessionStore
 from .memory.local_sqlite_store import LocalSQLiteMemoryStore
@@ -32,19 +39,35 @@ from .memory.memory_service import (
 )
 from .tools.preload_memory_tool import build_memory_preload_block
 
-TRUTHY_VALUES = {"1", "true", "yes", "on"}
-VALID_CONTENT_TYPES = {"code", "docs", "all"}
-VALID_KNOWLEDGE_MODES = {"strict", "all"}
-GROUNDED_ON_VALUES = {"on", "true", "1", "yes"}
-GROUNDED_OFF_VALUES = {"off", "false", "0", "no"}
-VALID_SCOPE_MODES = {"session", "user"}
-MODEL_RESET_VALUES = {"default", "reset"}
+# Lido uma vez no import: os prints de debug ficam atrás de uma constante no hot path.
+_DEBUG: Final[bool] = bool(os.environ.get("ACP_DEBUG", "").strip())
+
+TRUTHY_VALUES: frozenset[str] = frozenset({"1", "true", "yes", "on"})
+VALID_CONTENT_TYPES: frozenset[str] = frozenset({"code", "docs", "all"})
+VALID_KNOWLEDGE_MODES: frozenset[str] = frozenset({"strict", "all"})
+GROUNDED_ON_VALUES: frozenset[str] = frozenset({"on", "true", "1", "yes"})
+GROUNDED_OFF_VALUES: frozenset[str] = frozenset({"off", "false", "0", "no"})
+VALID_SCOPE_MODES: frozenset[str] = frozenset({"session", "user"})
+RESET_VALUES: frozenset[str] = frozenset({"default", "reset"})
 MODEL_PROFILES_ENV_KEY = "ACP_MODEL_PROFILES_FILE"
 DEFAULT_MODEL_PROFILES_FILE = "model-profiles.toml"
 DEFAULT_MEMORY_MAX_TURNS = 8
 DEFAULT_MEMORY_MAX_CHARS = 4000
 MAX_MEMORY_MAX_TURNS = 64
 MAX_MEMORY_MAX_CHARS = 16000
+STREAM_QUEUE_MAX_SIZE = 4
+SHUTDOWN_TIMEOUT_SECONDS = 5.0
+SESSION_IDLE_SWEEP_SECONDS = 60.0
+STREAM_COALESCE_MAX_CHARS = 1024
+ACP_META_MARKER = "__ACP_META__"
+REPO_EXISTS_CACHE_MAX_SIZE = 1024
+REPO_EXISTS_CACHE_TTL_SECONDS = 30.0
+_existing_repo_cache: dict[tuple[str, str], float] = {}
+_model_profiles_cache: (
+    tuple[tuple[Path, int, int], tuple[dict[str, ModelProfile], str | None]] | None
+) = None
+_SESSION_ID_PREFIX = "session-" + token_hex(6) + "-"
+_session_id_counter = itertools.count(1)
 AVAILABLE_SLASH_COMMANDS: tuple[dict[str, Any], ...] = (
     {
         "name": "repo",
@@ -83,6 +106,8 @@ AVAILABLE_SLASH_COMMANDS: tuple[dict[str, Any], ...] = (
         },
     },
 )
+# A lista é constante: o update é validado uma vez e reaproveitado em toda sessão nova.
+_AVAILABLE_COMMANDS_UPDATE = update_available_commands(AVAILABLE_SLASH_COMMANDS)
 
 
 @dataclass(frozen=True)
@@ -101,12 +126,44 @@ class ResolvedIdentity:
     source: str
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class LlmEnv:
+    model: str | None
+    provider: str | None
+    api_url: str | None
+    api_key: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class PromptConfig:
+    repo: str
+    path_prefix: str | None
+    language: str | None
+    top_k: int | None
+    min_score: float | None
+    grounded: bool
+    knowledge_mode: str | None
+    content_type: str | None
+    strict: bool
+    show_meta: bool
+    show_context: bool
+    stream_delay: float | None
+    stream_coalesce: float | None
+    memory_max_turns: int
+    memory_max_chars: int
+    codebase_root: str | None
+    llm_env: LlmEnv
+
+    @property
+    def meta_or_context(self) -> bool:
+        return self.show_meta or self.show_context
+
+
+@dataclass(slots=True)
 class SessionState:
     session_id: str
-    cancel_event: asyncio.Event
-    prompt_lock: asyncio.Lock
     mcp_bridge: McpBridge
+    cfg: PromptConfig
     runtime_mode: str = "local"
     memory_backend: str = "sqlite"
     session_backend: str = "memory"
@@ -130,6 +187,153 @@ class SessionState:
     memory_extractor: MemoryExtractor | None = None
     session_store: LocalSessionStore | None = None
     conversation_history: list[tuple[str, str]] = field(default_factory=list)
+    payload_template: dict[str, Any] | None = None
+    scope_cache: tuple[str, dict[str, Any]] | None = None
+    bridge_key: tuple[str | None, ...] | None = None
+    bridge_pool: _BridgePool | None = None
+    last_used: float = field(default_factory=time.monotonic)
+    active_prompts: int = 0
+    # Um evento por prompt em curso: o cancel sinaliza todos, e um prompt novo não apaga o
+    # cancelamento de um anterior que ainda está aguardando o MCP ou transmitindo.
+    cancel_events: set[asyncio.Event] = field(default_factory=set)
+
+
+class _AsyncLockRegistry:
+    # Locks por chave criados sob demanda. A entrada some do registro assim que nenhuma
+    # corrotina segura ou aguarda o lock, então sessões ociosas não mantêm locks vivos.
+    # O get-or-create não tem await, logo é atômico no loop e dispensa um lock de guarda.
+    def __init__(self) -> None:
+        self._locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[None]:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        async with lock:
+            yield
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class _BridgePool:
+    # Sessões com a mesma configuração efetiva de LLM (ver _bridge_key) compartilham um
+    # subprocesso MCP; o ask_code multiplexa requests por id no mesmo stdio. Sem await, logo
+    # acquire/release são atômicos no loop.
+    def __init__(self) -> None:
+        self._entries: dict[tuple[str | None, ...], tuple[McpBridge, int]] = {}
+
+    def acquire(self, key: tuple[str | None, ...], candidate: McpBridge) -> McpBridge:
+        # `candidate` só é registrado se ainda não houver bridge para a chave.
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = (candidate, 1)
+            return candidate
+        bridge, refs = entry
+        self._entries[key] = (bridge, refs + 1)
+        return bridge
+
+    def reserve(self, key: tuple[str | None, ...], candidate: McpBridge) -> McpBridge | None:
+        # Pré-aquecimento: registra `candidate` sem sessões (refs 0); o próximo acquire da
+        # mesma chave o reaproveita. None quando a chave já tem bridge.
+        if key in self._entries:
+            return None
+        self._entries[key] = (candidate, 0)
+        return candidate
+
+    def release(self, key: tuple[str | None, ...] | None) -> McpBridge | None:
+        # Devolve o bridge quando a última sessão o solta; cabe ao chamador fechá-lo.
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        bridge, refs = entry
+        if refs > 1:
+            self._entries[key] = (bridge, refs - 1)
+            return None
+        del self._entries[key]
+        return bridge
+
+    def bridges(self) -> list[McpBridge]:
+        return [bridge for bridge, _refs in self._entries.values()]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _FlushBuffer:
+    # Agrupa chunks consecutivos em um único session_update (estilo Nagle): envia ao
+    # atingir max_chars ou após max_delay desde o primeiro chunk pendente.
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        *,
+        max_chars: int,
+        max_delay: float,
+    ) -> None:
+        self._send = send
+        self._max_chars = max_chars
+        self._max_delay = max_delay
+        self._parts: list[str] = []
+        self._size = 0
+        self._timer: asyncio.Task[None] | None = None
+        self._send_lock = asyncio.Lock()
+        self._error: Exception | None = None
+
+    async def append(self, chunk: str) -> None:
+        self._raise_pending_error()
+        self._parts.append(chunk)
+        self._size += len(chunk)
+        if self._size >= self._max_chars:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        self._cancel_timer()
+        await self._flush_pending()
+        self._raise_pending_error()
+
+    def discard(self) -> None:
+        self._cancel_timer()
+        self._parts.clear()
+        self._size = 0
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._max_delay)
+        self._timer = None
+        try:
+            await self._flush_pending()
+        except Exception as exc:
+            self._error = exc
+
+    async def _flush_pending(self) -> None:
+        # O lock é FIFO: flushes concorrentes (timer x limite de tamanho) mantêm a ordem.
+        async with self._send_lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            await self._send(text)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
 
 
 class CodeCompassAgent(acp.Agent):
@@ -137,11 +341,22 @@ class CodeCompassAgent(acp.Agent):
         super().__init__()
         self._conn: acp.Client | None = None
         self._sessions: dict[str, SessionState] = {}
-        atexit.register(self._cleanup_all_sessions)
-        signal.signal(signal.SIGTERM, lambda *_: self._cleanup_all_sessions())
+        self._locks = _AsyncLockRegistry()
+        self._bridges = _BridgePool()
+        self._signal_loop: asyncio.AbstractEventLoop | None = None
+        self._shutdown_task: asyncio.Task[None] | None = None
+        self._idle_ttl = _resolve_session_idle_ttl()
+        self._idle_reaper: asyncio.Task[None] | None = None
+        self._prewarm = _is_truthy(os.getenv("ACP_MCP_PREWARM", ""))
+        self._warm_task: asyncio.Task[None] | None = None
+        # atexit é só o fallback síncrono; o SIGTERM é tratado no loop (ver on_connect).
+        # O registro é fraco para não manter agentes descartados (ex.: em testes) vivos.
+        _live_agents.add(self)
 
     def on_connect(self, conn: acp.Client) -> None:
         self._conn = conn
+        self._install_signal_handlers()
+        self._schedule_bridge_warmup()
 
     async def initialize(
         self,
@@ -162,21 +377,33 @@ class CodeCompassAgent(acp.Agent):
         **_kwargs: Any,
     ) -> acp.NewSessionResponse:
         _ = (cwd, mcp_servers)
-        llm_runtime = _resolve_llm_runtime(None)
+        cfg = _load_prompt_config()
+        llm_runtime = _resolve_llm_runtime(None, cfg.llm_env)
         runtime = build_runtime_adapter(llm_runtime, build_bridge_fn=build_bridge)
         if isinstance(runtime.adapter, LegacyRuntimeAdapter):
-            bridge = runtime.adapter.bridge
+            candidate = runtime.adapter.bridge
         else:
             # Fallback temporário: mantém o bridge legado enquanto ADK não está ativo.
-            bridge = _build_bridge_for_runtime(llm_runtime)
-        await bridge.start()
+            candidate = _build_bridge_for_runtime(llm_runtime)
+        bridge_key = _bridge_key(llm_runtime)
+        bridge = self._bridges.acquire(bridge_key, candidate)
+        try:
+            await bridge.start()
+        except Exception:
+            stale = self._bridges.release(bridge_key)
+            if stale is not None:
+                await stale.close()
+            raise
+        self._install_signal_handlers()
+        self._ensure_idle_reaper()
         session_id = _random_session_id()
 
         state = SessionState(
             session_id=session_id,
-            cancel_event=asyncio.Event(),
-            prompt_lock=asyncio.Lock(),
             mcp_bridge=bridge,
+            cfg=cfg,
+            bridge_key=bridge_key,
+            bridge_pool=self._bridges,
             runtime_mode=runtime.runtime_mode,
             memory_backend=runtime.memory_backend,
             session_backend=runtime.session_backend,
@@ -211,49 +438,42 @@ class CodeCompassAgent(acp.Agent):
 
     async def prompt(self, params: acp.PromptRequest) -> acp.PromptResponse:
         session_id = params.session_id
-        debug = os.getenv("ACP_DEBUG", "").strip()
         state = self._sessions.get(session_id)
-        if debug:
+        if _DEBUG:
             print(f"ACP prompt: session_id={session_id} state={'ok' if state else 'missing'}", file=sys.stderr)
         if not state:
             return acp.PromptResponse(stop_reason="refusal")
 
         question = _blocks_to_text(params.prompt)
-        if debug:
+        if _DEBUG:
             print(f"ACP prompt: question_len={len(question)}", file=sys.stderr)
         if not question:
             return acp.PromptResponse(stop_reason="refusal")
 
-        state.cancel_event.clear()
-        memory_context = _build_memory_context(state)
+        cancel_event = asyncio.Event()
+        state.cancel_events.add(cancel_event)
+        state.active_prompts += 1
+        try:
+            return await self._answer(session_id, state, question, cancel_event)
+        finally:
+            state.active_prompts -= 1
+            state.cancel_events.discard(cancel_event)
+            state.last_used = time.monotonic()
 
-        async with state.prompt_lock:
+    async def _answer(
+        self,
+        session_id: str,
+        state: SessionState,
+        question: str,
+        cancel_event: asyncio.Event,
+    ) -> acp.PromptResponse:
+        # O lock cobre apenas comandos e a montagem do payload; o round-trip MCP e o
+        # streaming rodam fora dele para não serializar prompts concorrentes em I/O.
+        async with self._locks.acquire(session_id):
+            bridge = state.mcp_bridge
+            memory_context = _build_memory_context(state)
             try:
-                command_response = await _handle_config_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_memory_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_repo_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_model_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_grounded_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_knowledge_command(self._conn, session_id, state, question)
-                if command_response is not None:
-                    return command_response
-
-                command_response = await _handle_content_type_command(self._conn, session_id, state, question)
+                command_response = await self._handle_command(session_id, state, question)
                 if command_response is not None:
                     return command_response
 
@@ -265,46 +485,44 @@ class CodeCompassAgent(acp.Agent):
                     state,
                     conversation_context=conversation_context,
                 )
-                result = await state.mcp_bridge.ask_code(payload, state.cancel_event)
             except asyncio.CancelledError:
                 return acp.PromptResponse(stop_reason="cancelled")
             except Exception as exc:
-                if state.mcp_bridge:
-                    await state.mcp_bridge.close()
-                error_message = (
-                    "Falha ao consultar o MCP. "
-                    f"Detalhe técnico: {exc}"
+                return await self._report_mcp_failure(session_id, bridge, exc)
+
+        try:
+            result = await bridge.ask_code(payload, cancel_event)
+        except asyncio.CancelledError:
+            return acp.PromptResponse(stop_reason="cancelled")
+        except Exception as exc:
+            return await self._report_mcp_failure(session_id, bridge, exc)
+
+        raw_answer = result.get("answer")
+        if isinstance(raw_answer, str):
+            answer = raw_answer
+        else:
+            answer = "" if raw_answer is None else str(raw_answer)
+        cfg = state.cfg
+        if cfg.meta_or_context and self._conn:
+            meta_payload: dict[str, Any] = {}
+            if cfg.show_meta:
+                meta = result.get("meta")
+                if isinstance(meta, dict):
+                    meta_payload["meta"] = meta
+            if cfg.show_context:
+                evidences = result.get("evidences")
+                if isinstance(evidences, list):
+                    meta_payload["evidences"] = evidences
+            if meta_payload:
+                # Update próprio, antes da resposta: é o formato que os clientes ACP esperam.
+                await self._send_update(
+                    session_id, ACP_META_MARKER + json_codec.dumps(meta_payload)
                 )
-                print(f"Erro MCP: {exc}", file=sys.stderr)
-                await self._send_update(session_id, error_message)
-                return acp.PromptResponse(stop_reason="end_turn")
-
-            answer = str(result.get("answer", ""))
-            show_meta = _is_truthy(os.getenv("ACP_SHOW_META", ""))
-            show_context = _is_truthy(os.getenv("ACP_SHOW_CONTEXT", ""))
-            if (show_meta or show_context) and self._conn:
-                meta_payload: dict[str, Any] = {}
-                if show_meta and isinstance(result.get("meta"), dict):
-                    meta_payload["meta"] = result.get("meta")
-                if show_context and isinstance(result.get("evidences"), list):
-                    meta_payload["evidences"] = result.get("evidences")
-                if meta_payload:
-                    marker = "__ACP_META__"
-                    await self._conn.session_update(
-                        session_id,
-                        acp.update_agent_message_text(f"{marker}{json.dumps(meta_payload, ensure_ascii=False)}"),
-                    )
-            for chunk in chunk_by_paragraph(answer):
-                if state.cancel_event.is_set():
-                    return acp.PromptResponse(stop_reason="cancelled")
-                await self._send_update(session_id, chunk)
-                delay = os.getenv("ACP_TEST_SLOW_STREAM", "").strip()
-                if delay:
-                    try:
-                        await asyncio.sleep(float(delay))
-                    except ValueError:
-                        pass
+        # Resposta vazia: nada a transmitir, evita montar fila/consumidor.
+        if answer and not await self._stream_answer(session_id, answer, cancel_event, cfg):
+            return acp.PromptResponse(stop_reason="cancelled")
 
+        async with self._locks.acquire(session_id):
             _remember_turn(
                 state,
                 question,
@@ -340,8 +558,107 @@ class CodeCompassAgent(acp.Agent):
         if not state:
             return
 
-        state.cancel_event.set()
-        await state.mcp_bridge.abort()
+        # O bridge pode ser compartilhado: cada ask_code em curso descarta só o próprio request.
+        for cancel_event in state.cancel_events:
+            cancel_event.set()
+
+    async def _handle_command(
+        self,
+        session_id: str,
+        state: SessionState,
+        question: str,
+    ) -> acp.PromptResponse | None:
+        # Prompts comuns não começam com "/": evita strip/split em todos os handlers.
+        if question[:1] != "/":
+            return None
+        command = question.split(None, 1)[0].lower().replace("-", "")
+        handler = _COMMAND_HANDLERS.get(command)
+        if handler is None:
+            return None
+        if command in PAYLOAD_OVERRIDE_COMMANDS:
+            # Comando pode alterar overrides do payload; o template é refeito no próximo ask.
+            state.payload_template = None
+        return await handler(self._conn, session_id, state, question)
+
+    async def _report_mcp_failure(
+        self,
+        session_id: str,
+        bridge: McpBridge,
+        exc: Exception,
+    ) -> acp.PromptResponse:
+        # Erros de aplicação (tool com isError, resposta inválida) não derrubam o subprocesso e
+        # fechá-lo cancelaria asks concorrentes da sessão; só recolhe o bridge se o MCP morreu.
+        # O próximo ask_code reinicia o processo sob demanda via start().
+        if not bridge.is_alive:
+            await bridge.close()
+        error_message = (
+            "Falha ao consultar o MCP. "
+            f"Detalhe técnico: {exc}"
+        )
+        print(f"Erro MCP: {exc}", file=sys.stderr)
+        await self._send_update(session_id, error_message)
+        return acp.PromptResponse(stop_reason="end_turn")
+
+    async def _stream_answer(
+        self,
+        session_id: str,
+        answer: str,
+        cancel_event: asyncio.Event,
+        cfg: PromptConfig,
+    ) -> bool:
+        # Produtor/consumidor: a divisão em chunks segue enquanto o envio anterior aguarda I/O.
+        # Um único consumidor preserva a ordem de entrega. Retorna False se cancelado.
+        queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=STREAM_QUEUE_MAX_SIZE)
+        cancelled = False
+        stream_delay = cfg.stream_delay
+        send: Callable[[str], Awaitable[None]] = functools.partial(self._send_update, session_id)
+        buffer: _FlushBuffer | None = None
+        if cfg.stream_coalesce is not None:
+            buffer = _FlushBuffer(
+                send,
+                max_chars=STREAM_COALESCE_MAX_CHARS,
+                max_delay=cfg.stream_coalesce,
+            )
+            send = buffer.append
+
+        async def _drain() -> None:
+            nonlocal cancelled
+            error: Exception | None = None
+            while (chunk := await queue.get()) is not None:
+                # Após cancelamento ou falha, apenas esvazia a fila para liberar o produtor.
+                if error is not None or cancelled:
+                    continue
+                if cancel_event.is_set():
+                    cancelled = True
+                    continue
+                try:
+                    await send(chunk)
+                    if stream_delay is not None:
+                        # Espera no próprio evento: um cancel durante o atraso encerra na hora.
+                        with contextlib.suppress(TimeoutError):
+                            await asyncio.wait_for(cancel_event.wait(), stream_delay)
+                except Exception as exc:
+                    error = exc
+            if buffer is not None and error is None:
+                await buffer.flush()
+            if error is not None:
+                raise error
+
+        sender = asyncio.create_task(_drain())
+        try:
+            for chunk in iter_paragraph_chunks(answer):
+                if cancel_event.is_set():
+                    cancelled = True
+                    break
+                await queue.put(chunk)
+            await queue.put(None)
+            await sender
+        finally:
+            if not sender.done():
+                sender.cancel()
+            if buffer is not None:
+                buffer.discard()
+        return not cancelled
 
     async def _send_update(self, session_id: str, chunk: str) -> None:
         if not self._conn:
@@ -357,18 +674,162 @@ class CodeCompassAgent(acp.Agent):
         try:
             await self._conn.session_update(
                 session_id,
-                update_available_commands(AVAILABLE_SLASH_COMMANDS),
+                _AVAILABLE_COMMANDS_UPDATE,
             )
         except Exception as exc:
             print(f"Erro ao anunciar comandos ACP: {exc}", file=sys.stderr)
 
-    def _cleanup_all_sessions(self) -> None:
+    def _install_signal_handlers(self) -> None:
+        # Com o loop rodando, o SIGTERM agenda o fechamento nele em vez de criar outro loop.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._signal_loop is loop:
+            return
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self._handle_sigterm)
+        except (NotImplementedError, RuntimeError, ValueError):
+            return
+        self._signal_loop = loop
+
+    def _handle_sigterm(self) -> None:
+        if self._shutdown_task is None or self._shutdown_task.done():
+            self._shutdown_task = asyncio.get_running_loop().create_task(self._terminate())
+
+    async def _terminate(self) -> None:
+        await self._close_all_sessions()
+        # Restaura a disposição padrão e repassa o sinal para o processo de fato encerrar.
+        loop = asyncio.get_running_loop()
+        loop.remove_signal_handler(signal.SIGTERM)
+        self._signal_loop = None
+        signal.raise_signal(signal.SIGTERM)
+
+    def _schedule_shutdown(self) -> None:
+        if self._shutdown_task is None or self._shutdown_task.done():
+            self._shutdown_task = asyncio.get_running_loop().create_task(
+                self._close_all_sessions()
+            )
+
+    def _schedule_bridge_warmup(self) -> None:
+        if not self._prewarm or self._warm_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._warm_task = loop.create_task(self._warm_bridge())
+
+    async def _warm_bridge(self) -> None:
+        # Sobe o subprocesso MCP da configuração default já na conexão, fora do caminho do
+        # primeiro new_session, que o reaproveita pelo pool (mesma _bridge_key).
+        llm_runtime = _resolve_llm_runtime(None, _load_prompt_config().llm_env)
+        bridge = self._bridges.reserve(
+            _bridge_key(llm_runtime), _build_bridge_for_runtime(llm_runtime)
+        )
+        if bridge is None:
+            return
+        try:
+            await bridge.start()
+        except Exception as exc:
+            # Não é fatal: o new_session tenta de novo e reporta a falha ao cliente.
+            print(f"Falha ao pré-aquecer o MCP: {exc}", file=sys.stderr)
+
+    def _ensure_idle_reaper(self) -> None:
+        if self._idle_ttl is None:
+            return
+        if self._idle_reaper is None or self._idle_reaper.done():
+            self._idle_reaper = asyncio.get_running_loop().create_task(self._reap_idle_bridges())
+
+    async def _reap_idle_bridges(self) -> None:
+        # Fecha o subprocesso MCP quando todas as sessões que o usam estão ociosas; o estado
+        # da sessão (histórico, overrides) é mantido e o próximo ask_code reinicia o bridge.
+        ttl = self._idle_ttl
+        assert ttl is not None
+        interval = min(SESSION_IDLE_SWEEP_SECONDS, ttl)
+        while True:
+            await asyncio.sleep(interval)
+            candidates = {
+                id(state.mcp_bridge): state.mcp_bridge
+                for state in self._sessions.values()
+                if self._is_idle(state, ttl)
+            }
+            for bridge in candidates.values():
+                # Revalida a cada bridge: um prompt pode ter começado durante o close anterior.
+                # Do check ao close não há await; um start posterior espera o close terminar.
+                if all(
+                    self._is_idle(state, ttl)
+                    for state in self._sessions.values()
+                    if state.mcp_bridge is bridge
+                ):
+                    await bridge.close()
+
+    @staticmethod
+    def _is_idle(state: SessionState, ttl: float) -> bool:
+        return (
+            state.active_prompts == 0
+            and time.monotonic() - state.last_used > ttl
+            and state.mcp_bridge.is_alive
+        )
+
+    async def _close_all_sessions(self) -> None:
+        if self._idle_reaper is not None:
+            self._idle_reaper.cancel()
+            self._idle_reaper = None
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        bridges = self._distinct_bridges()
+        self._sessions.clear()
+        self._bridges.clear()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    *(bridge.close() for bridge in bridges.values()),
+                    return_exceptions=True,
+                ),
+                timeout=SHUTDOWN_TIMEOUT_SECONDS,
+            )
+        except TimeoutError:
+            print("Timeout ao encerrar bridges MCP no shutdown.", file=sys.stderr)
+
+    async def aclose(self) -> None:
+        # Encerramento gracioso no próprio loop, chamado pelo entrypoint ao fim do run_agent.
+        await self._close_all_sessions()
+
+    def _distinct_bridges(self) -> dict[int, McpBridge]:
+        # Sessões podem compartilhar bridge e o pool pode ter um pré-aquecido ainda sem
+        # sessão: cada subprocesso é fechado uma única vez.
+        bridges = {id(bridge): bridge for bridge in self._bridges.bridges()}
         for state in self._sessions.values():
-            try:
-                asyncio.run(state.mcp_bridge.close())
-            except RuntimeError:
-                pass
+            bridges[id(state.mcp_bridge)] = state.mcp_bridge
+        return bridges
+
+    def _cleanup_all_sessions(self) -> None:
+        if not self._sessions and not self._bridges:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self._schedule_shutdown()
+            return
+        # Sem loop (atexit após o asyncio.run): os transports dos subprocessos pertencem ao
+        # loop que já fechou, então um loop novo não conseguiria aguardá-los. Só sinaliza.
+        bridges = self._distinct_bridges()
         self._sessions.clear()
+        self._bridges.clear()
+        for bridge in bridges.values():
+            bridge.terminate()
+
+
+_live_agents: weakref.WeakSet[CodeCompassAgent] = weakref.WeakSet()
+
+
+@atexit.register
+def _cleanup_live_agents() -> None:
+    for agent in list(_live_agents):
+        agent._cleanup_all_sessions()
 
 
 def _blocks_to_text(
@@ -380,11 +841,13 @@ def _blocks_to_text(
         | acp.EmbeddedResourceContentBlock
     ]
 ) -> str:
-    parts: list[str] = []
-    for block in blocks:
-        if getattr(block, "type", None) == "text":
-            parts.append(getattr(block, "text", ""))
-    return "\n".join(parts).strip()
+    # Prompt de um único bloco de texto é o caso comum; evita montar lista e join.
+    if len(blocks) == 1:
+        block = blocks[0]
+        return block.text.strip() if isinstance(block, acp.TextContentBlock) else ""
+    return "\n".join(
+        [block.text for block in blocks if isinstance(block, acp.TextContentBlock)]
+    ).strip()
 
 
 async def _handle_config_command(
@@ -393,12 +856,8 @@ async def _handle_config_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/config"):
-        return None
-
     config = _build_runtime_config(state)
-    formatted_config = json.dumps(config, ensure_ascii=False, indent=2)
+    formatted_config = json_codec.dumps(config, indent=True)
     reply = f"Config atual:\n```json\n{formatted_config}\n```"
 
     if conn:
@@ -433,21 +892,17 @@ async def _handle_repo_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/repo"):
-        return None
-    parts = text.split(maxsplit=1)
+    parts = question.split(maxsplit=1)
     if len(parts) == 1:
-        reply = f"Repo atual: {state.repo_override or os.getenv('ACP_REPO', 'code-compass')}"
+        reply = f"Repo atual: {state.repo_override or state.cfg.repo}"
     else:
         repos = _parse_repos_csv(parts[1])
         if not repos:
             reply = "Nome do repo vazio. Use /repo <nome> ou /repo repo-a,repo-b."
         else:
-            missing_repos: list[str] = []
-            for repo in repos:
-                if not await _repo_exists(repo):
-                    missing_repos.append(repo)
+            codebase_root = state.cfg.codebase_root
+            found = await asyncio.gather(*(_repo_exists(repo, codebase_root) for repo in repos))
+            missing_repos = [repo for repo, exists in zip(repos, found) if not exists]
 
             if missing_repos:
                 if len(missing_repos) == 1:
@@ -472,17 +927,39 @@ async def _handle_repo_command(
     return acp.PromptResponse(stop_reason="end_turn")
 
 
-async def _repo_exists(repo: str) -> bool:
-    codebase_root = os.getenv("CODEBASE_ROOT", "").strip()
+async def _repo_exists(repo: str, codebase_root: str | None) -> bool:
     if not codebase_root:
         return True
+    # Só resultados positivos ficam em cache (com TTL): o usuário pode criar o repo depois.
+    cache_key = (codebase_root, repo)
+    now = time.monotonic()
+    expires_at = _existing_repo_cache.get(cache_key)
+    if expires_at is not None and expires_at > now:
+        return True
+    exists = await asyncio.to_thread(_probe_repo_dir, codebase_root, repo)
+    if exists:
+        # dict mantém ordem de inserção: reinserir move a chave para o fim e a mais antiga sai.
+        _existing_repo_cache.pop(cache_key, None)
+        if len(_existing_repo_cache) >= REPO_EXISTS_CACHE_MAX_SIZE:
+            del _existing_repo_cache[next(iter(_existing_repo_cache))]
+        _existing_repo_cache[cache_key] = now + REPO_EXISTS_CACHE_TTL_SECONDS
+    else:
+        _existing_repo_cache.pop(cache_key, None)
+    return exists
+
+
+def _probe_repo_dir(codebase_root: str, repo: str) -> bool:
     try:
-        repo_path = Path(codebase_root) / repo
-        return repo_path.exists() and repo_path.is_dir()
+        return (_codebase_root_path(codebase_root) / repo).is_dir()
     except Exception:
         return False
 
 
+@functools.lru_cache(maxsize=8)
+def _codebase_root_path(codebase_root: str) -> Path:
+    return Path(codebase_root)
+
+
 def _repo_root() -> Path:
     return Path(__file__).resolve().parents[4]
 
@@ -504,17 +981,31 @@ def _resolve_llm_api_key_from_env() -> str | None:
     )
 
 
-def _resolve_llm_runtime(state: SessionState | None) -> dict[str, str | None]:
-    env_model = _coerce_optional_string(os.getenv("LLM_MODEL", ""))
-    env_provider = (
-        _coerce_optional_string(os.getenv("LLM_MODEL_PROVIDER", ""))
-        or _coerce_optional_string(os.getenv("LLM_PROVIDER", ""))
-    )
-    env_api_url = (
-        _coerce_optional_string(os.getenv("LLM_MODEL_API_URL", ""))
-        or _coerce_optional_string(os.getenv("LLM_API_BASE_URL", ""))
+def _load_llm_env() -> LlmEnv:
+    return LlmEnv(
+        model=_coerce_optional_string(os.getenv("LLM_MODEL", "")),
+        provider=(
+            _coerce_optional_string(os.getenv("LLM_MODEL_PROVIDER", ""))
+            or _coerce_optional_string(os.getenv("LLM_PROVIDER", ""))
+        ),
+        api_url=(
+            _coerce_optional_string(os.getenv("LLM_MODEL_API_URL", ""))
+            or _coerce_optional_string(os.getenv("LLM_API_BASE_URL", ""))
+        ),
+        api_key=_resolve_llm_api_key_from_env(),
     )
-    env_api_key = _resolve_llm_api_key_from_env()
+
+
+def _resolve_llm_runtime(
+    state: SessionState | None,
+    llm_env: LlmEnv | None = None,
+) -> dict[str, str | None]:
+    if llm_env is None:
+        llm_env = state.cfg.llm_env if state else _load_llm_env()
+    env_model = llm_env.model
+    env_provider = llm_env.provider
+    env_api_url = llm_env.api_url
+    env_api_key = llm_env.api_key
 
     model_override = state.model_override if state else None
     provider_override = state.llm_provider_override if state else None
@@ -556,22 +1047,46 @@ def _build_bridge_for_runtime(llm_runtime: dict[str, str | None]) -> McpBridge:
     return build_bridge(**kwargs)
 
 
-def _build_bridge_for_state(state: SessionState) -> McpBridge:
-    llm_runtime = _resolve_llm_runtime(state)
-    return _build_bridge_for_runtime(llm_runtime)
+def _bridge_key(llm_runtime: dict[str, str | None]) -> tuple[str | None, ...]:
+    # Valores efetivos que chegam ao subprocesso MCP; mesma chave = mesmo processo.
+    return (
+        llm_runtime.get("model"),
+        llm_runtime.get("provider"),
+        llm_runtime.get("api_url"),
+        llm_runtime.get("api_key"),
+    )
 
 
 async def _refresh_bridge_for_model_settings(state: SessionState) -> None:
-    new_bridge = _build_bridge_for_state(state)
+    llm_runtime = _resolve_llm_runtime(state)
+    bridge_key = _bridge_key(llm_runtime)
+    if bridge_key == state.bridge_key:
+        # /model sem mudança efetiva (ex.: reset já no default): evita reiniciar o MCP.
+        return
+
+    pool = state.bridge_pool
+    new_bridge = _build_bridge_for_runtime(llm_runtime)
+    if pool is not None:
+        new_bridge = pool.acquire(bridge_key, new_bridge)
     try:
         await new_bridge.start()
     except Exception:
-        await new_bridge.close()
+        stale = pool.release(bridge_key) if pool is not None else new_bridge
+        if stale is not None:
+            await stale.close()
         raise
 
     previous_bridge = state.mcp_bridge
+    previous_key = state.bridge_key
     state.mcp_bridge = new_bridge
-    await previous_bridge.close()
+    state.bridge_key = bridge_key
+    if pool is None:
+        await previous_bridge.close()
+        return
+    # Bridge anterior só fecha se nenhuma outra sessão ainda o usa.
+    stale = pool.release(previous_key)
+    if stale is not None:
+        await stale.close()
 
 
 def _snapshot_model_overrides(
@@ -610,10 +1125,23 @@ def _resolve_model_profiles_path() -> Path:
 
 
 def _load_model_profiles() -> tuple[dict[str, ModelProfile], str | None]:
+    # Um stat por /model: o TOML só é relido quando caminho, mtime ou tamanho mudam.
+    global _model_profiles_cache
     profiles_path = _resolve_model_profiles_path()
-    if not profiles_path.exists():
+    try:
+        stat_result = profiles_path.stat()
+    except OSError:
         return {}, None
 
+    cache_key = (profiles_path, stat_result.st_mtime_ns, stat_result.st_size)
+    if _model_profiles_cache is not None and _model_profiles_cache[0] == cache_key:
+        return _model_profiles_cache[1]
+    result = _parse_model_profiles(profiles_path)
+    _model_profiles_cache = (cache_key, result)
+    return result
+
+
+def _parse_model_profiles(profiles_path: Path) -> tuple[dict[str, ModelProfile], str | None]:
     try:
         with profiles_path.open("rb") as file_obj:
             raw = tomllib.load(file_obj)
@@ -692,13 +1220,14 @@ def _build_runtime_config(state: SessionState) -> dict[str, Any]:
     payload_preview.pop("query", None)
     payload_preview.pop("conversationContext", None)
 
-    active_repo = (state.repo_override or os.getenv("ACP_REPO", "code-compass")).strip()
+    cfg = state.cfg
+    active_repo = (state.repo_override or cfg.repo).strip()
     llm_runtime = _resolve_llm_runtime(state)
-    content_type_env = _resolve_content_type_from_env()
+    content_type_env = cfg.content_type
     content_type_active = _resolve_content_type(state)
-    grounded_env = _is_truthy(os.getenv("ACP_GROUNDED", ""))
+    grounded_env = cfg.grounded
     grounded_active = _resolve_grounded(state)
-    knowledge_mode_env = _resolve_knowledge_mode_from_env()
+    knowledge_mode_env = cfg.knowledge_mode
     knowledge_mode_active = _resolve_knowledge_mode(state)
     app_name = _resolve_app_name(state)
     identity = _resolve_identity(state)
@@ -732,7 +1261,7 @@ def _build_runtime_config(state: SessionState) -> dict[str, Any]:
         "repo": {
             "active": active_repo,
             "override": state.repo_override,
-            "env": os.getenv("ACP_REPO", "code-compass").strip(),
+            "env": cfg.repo,
         },
         "model": {
             "active": llm_runtime.get("model"),
@@ -782,8 +1311,8 @@ def _build_runtime_config(state: SessionState) -> dict[str, Any]:
         },
         "memory": {
             "turnsStored": len(state.conversation_history),
-            "maxTurns": _resolve_memory_max_turns(),
-            "maxChars": _resolve_memory_max_chars(),
+            "maxTurns": cfg.memory_max_turns,
+            "maxChars": cfg.memory_max_chars,
             "contextChars": len(merged_context),
             "sessionId": state.session_id,
             "userId": identity.user_id,
@@ -791,10 +1320,10 @@ def _build_runtime_config(state: SessionState) -> dict[str, Any]:
             "scopeId": memory_context.scope_id if memory_context else None,
         },
         "passthrough": {
-            "showMeta": _is_truthy(os.getenv("ACP_SHOW_META", "")),
-            "showContext": _is_truthy(os.getenv("ACP_SHOW_CONTEXT", "")),
+            "showMeta": cfg.show_meta,
+            "showContext": cfg.show_context,
         },
-        "codebaseRoot": os.getenv("CODEBASE_ROOT", "").strip() or None,
+        "codebaseRoot": cfg.codebase_root,
         "askCodePayloadPreview": payload_preview,
     }
 
@@ -805,49 +1334,74 @@ def _build_ask_payload(
     *,
     conversation_context: str = "",
 ) -> dict[str, Any]:
-    raw_repo = (state.repo_override or os.getenv("ACP_REPO", "code-compass")).strip()
-    payload: dict[str, Any] = {
-        "query": question,
-        "scope": _resolve_scope(raw_repo),
-    }
+    template = state.payload_template
+    if template is None:
+        template = state.payload_template = _build_payload_template(state)
+
+    payload: dict[str, Any] = {"query": question, **template}
+    if conversation_context:
+        payload["conversationContext"] = conversation_context
+    return payload
+
+
+def _build_payload_template(state: SessionState) -> dict[str, Any]:
+    # Parte do payload que só muda com env/overrides; reaproveitada entre turnos.
+    cfg = state.cfg
+    raw_repo = (state.repo_override or cfg.repo).strip()
+    template: dict[str, Any] = {"scope": _resolve_session_scope(state, raw_repo)}
 
-    path_prefix = os.getenv("ACP_PATH_PREFIX", "").strip()
-    language = os.getenv("ACP_LANGUAGE", "").strip()
-    top_k = _parse_int(os.getenv("ACP_TOPK", ""))
-    min_score = _parse_float(os.getenv("ACP_MIN_SCORE", ""))
     llm_model = _resolve_llm_runtime(state).get("model")
     grounded = _resolve_grounded(state)
-    knowledge_mode = _resolve_knowledge_mode(state)
     content_type = _resolve_content_type(state)
-    strict = _is_truthy(os.getenv("ACP_STRICT", ""))
-
-    if path_prefix:
-        payload["pathPrefix"] = path_prefix
-    if language:
-        payload["language"] = language
-    if top_k is not None:
-        payload["topK"] = top_k
-    if min_score is not None:
-        payload["minScore"] = min_score
+
+    if cfg.path_prefix:
+        template["pathPrefix"] = cfg.path_prefix
+    if cfg.language:
+        template["language"] = cfg.language
+    if cfg.top_k is not None:
+        template["topK"] = cfg.top_k
+    if cfg.min_score is not None:
+        template["minScore"] = cfg.min_score
     if isinstance(llm_model, str) and llm_model:
-        payload["llmModel"] = llm_model
-    payload["knowledgeMode"] = knowledge_mode
-    if conversation_context:
-        payload["conversationContext"] = conversation_context
+        template["llmModel"] = llm_model
+    template["knowledgeMode"] = _resolve_knowledge_mode(state)
     if grounded:
-        payload["grounded"] = True
+        template["grounded"] = True
     if content_type:
-        payload["contentType"] = content_type
-    if strict:
-        payload["strict"] = True
-
-    return payload
+        template["contentType"] = content_type
+    if cfg.strict:
+        template["strict"] = True
+
+    return template
+
+
+def _load_prompt_config() -> PromptConfig:
+    # Snapshot do ambiente feito uma vez por sessão; o hot path do prompt só lê atributos.
+    return PromptConfig(
+        repo=os.getenv("ACP_REPO", "code-compass").strip(),
+        path_prefix=_coerce_optional_string(os.getenv("ACP_PATH_PREFIX", "")),
+        language=_coerce_optional_string(os.getenv("ACP_LANGUAGE", "")),
+        top_k=_parse_int(os.getenv("ACP_TOPK", "")),
+        min_score=_parse_float(os.getenv("ACP_MIN_SCORE", "")),
+        grounded=_is_truthy(os.getenv("ACP_GROUNDED", "")),
+        knowledge_mode=_resolve_knowledge_mode_from_env(),
+        content_type=_resolve_content_type_from_env(),
+        strict=_is_truthy(os.getenv("ACP_STRICT", "")),
+        show_meta=_is_truthy(os.getenv("ACP_SHOW_META", "")),
+        show_context=_is_truthy(os.getenv("ACP_SHOW_CONTEXT", "")),
+        stream_delay=_parse_float(os.getenv("ACP_TEST_SLOW_STREAM", "")),
+        stream_coalesce=_parse_stream_coalesce(os.getenv("ACP_STREAM_COALESCE_MS", "")),
+        memory_max_turns=_resolve_memory_max_turns(),
+        memory_max_chars=_resolve_memory_max_chars(),
+        codebase_root=_coerce_optional_string(os.getenv("CODEBASE_ROOT", "")),
+        llm_env=_load_llm_env(),
+    )
 
 
 def _resolve_grounded(state: SessionState) -> bool:
     if state.grounded_override is not None:
         return state.grounded_override
-    return _is_truthy(os.getenv("ACP_GROUNDED", ""))
+    return state.cfg.grounded
 
 
 def _resolve_content_type_from_env() -> str | None:
@@ -860,7 +1414,7 @@ def _resolve_content_type_from_env() -> str | None:
 def _resolve_content_type(state: SessionState) -> str | None:
     if state.content_type_override in VALID_CONTENT_TYPES:
         return state.content_type_override
-    return _resolve_content_type_from_env()
+    return state.cfg.content_type
 
 
 def _resolve_knowledge_mode_from_env() -> str | None:
@@ -873,7 +1427,17 @@ def _resolve_knowledge_mode_from_env() -> str | None:
 def _resolve_knowledge_mode(state: SessionState) -> str:
     if state.knowledge_mode_override in VALID_KNOWLEDGE_MODES:
         return state.knowledge_mode_override
-    return _resolve_knowledge_mode_from_env() or "strict"
+    return state.cfg.knowledge_mode or "strict"
+
+
+def _resolve_session_scope(state: SessionState, raw_repo: str) -> dict[str, Any]:
+    # O template é refeito após qualquer comando; o scope só muda quando o repo muda.
+    cached = state.scope_cache
+    if cached is not None and cached[0] == raw_repo:
+        return cached[1]
+    scope = _resolve_scope(raw_repo)
+    state.scope_cache = (raw_repo, scope)
+    return scope
 
 
 def _resolve_scope(raw_repo: str) -> dict[str, Any]:
@@ -886,24 +1450,31 @@ def _resolve_scope(raw_repo: str) -> dict[str, Any]:
 
 
 def _parse_repos_csv(value: str) -> list[str]:
-    repos: list[str] = []
-    for raw_repo in value.split(","):
-        repo = raw_repo.strip()
-        if not repo:
-            continue
-        if repo not in repos:
-            repos.append(repo)
-    return repos
+    # dict.fromkeys deduplica em O(n) preservando a ordem de entrada.
+    return list(dict.fromkeys(repo for repo in map(str.strip, value.split(",")) if repo))
+
+
+def _resolve_session_idle_ttl() -> float | None:
+    ttl = _parse_float(os.getenv("ACP_SESSION_IDLE_TTL_SECONDS", ""))
+    if ttl is None or ttl <= 0:
+        return None
+    return ttl
+
+
+def _parse_stream_coalesce(value: str) -> float | None:
+    delay_ms = _parse_float(value)
+    if delay_ms is None or delay_ms <= 0:
+        return None
+    return delay_ms / 1000
 
 
 def _parse_int(value: str) -> int | None:
     value = value.strip()
-    if not value:
-        return None
-    try:
-        return int(value)
-    except ValueError:
+    # Valida os dígitos antes de int(): entrada malformada não passa por exceção.
+    digits = value[1:] if value[:1] in ("+", "-") else value
+    if not digits.isdecimal():
         return None
+    return int(value)
 
 
 def _parse_float(value: str) -> float | None:
@@ -917,7 +1488,8 @@ def _parse_float(value: str) -> float | None:
 
 
 def _is_truthy(value: str) -> bool:
-    return value.strip().lower() in TRUTHY_VALUES
+    # Env não definida é o caso comum: evita strip/lower de string vazia.
+    return bool(value) and value.strip().lower() in TRUTHY_VALUES
 
 
 def _resolve_memory_max_turns() -> int:
@@ -946,8 +1518,8 @@ def _build_conversation_context(state: SessionState) -> str:
     if not state.conversation_history:
         return ""
 
-    max_turns = _resolve_memory_max_turns()
-    max_chars = _resolve_memory_max_chars()
+    max_turns = state.cfg.memory_max_turns
+    max_chars = state.cfg.memory_max_chars
     recent_turns = state.conversation_history[-max_turns:]
     selected_blocks: list[str] = []
     total_chars = 0
@@ -984,7 +1556,7 @@ def _remember_turn(
 
     state.conversation_history.append((user_text, assistant_text))
     # Guarda um buffer acima do limite efetivo para evitar churn excessivo.
-    max_stored_turns = max(32, _resolve_memory_max_turns() * 3)
+    max_stored_turns = max(32, state.cfg.memory_max_turns * 3)
     overflow = len(state.conversation_history) - max_stored_turns
     if overflow > 0:
         del state.conversation_history[:overflow]
@@ -1045,11 +1617,7 @@ async def _handle_model_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/model"):
-        return None
-
-    parts = text.split(maxsplit=1)
+    parts = question.split(maxsplit=1)
     if len(parts) == 1:
         llm_runtime = _resolve_llm_runtime(state)
         active_model = llm_runtime.get("model") or "default"
@@ -1066,7 +1634,7 @@ async def _handle_model_command(
             previous_snapshot = _snapshot_model_overrides(state)
             state_changed = False
             try:
-                if selector.lower() in MODEL_RESET_VALUES:
+                if selector.lower() in RESET_VALUES:
                     state.model_override = None
                     state.model_profile_override = None
                     state.llm_provider_override = None
@@ -1139,11 +1707,7 @@ async def _handle_grounded_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/grounded"):
-        return None
-
-    parts = text.split(maxsplit=1)
+    parts = question.split(maxsplit=1)
     if len(parts) == 1:
         status = "on" if _resolve_grounded(state) else "off"
         source = "sessão" if state.grounded_override is not None else "env"
@@ -1156,7 +1720,7 @@ async def _handle_grounded_command(
         elif value in GROUNDED_OFF_VALUES:
             state.grounded_override = False
             reply = "Grounded desativado para esta sessão."
-        elif value in {"reset", "default"}:
+        elif value in RESET_VALUES:
             state.grounded_override = None
             reply = "Grounded resetado para o valor do ambiente."
         else:
@@ -1173,16 +1737,12 @@ async def _handle_knowledge_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/knowledge"):
-        return None
-
-    parts = text.split(maxsplit=1)
+    parts = question.split(maxsplit=1)
     if len(parts) == 1:
         active = _resolve_knowledge_mode(state)
         if state.knowledge_mode_override in VALID_KNOWLEDGE_MODES:
             source = "sessão"
-        elif _resolve_knowledge_mode_from_env() is not None:
+        elif state.cfg.knowledge_mode is not None:
             source = "env"
         else:
             source = "default"
@@ -1192,7 +1752,7 @@ async def _handle_knowledge_command(
         if value in VALID_KNOWLEDGE_MODES:
             state.knowledge_mode_override = value
             reply = f"knowledgeMode atualizado para: {value}"
-        elif value in {"reset", "default"}:
+        elif value in RESET_VALUES:
             state.knowledge_mode_override = None
             reply = "knowledgeMode resetado para o valor do ambiente."
         else:
@@ -1209,16 +1769,8 @@ async def _handle_content_type_command(
     state: SessionState,
     question: str,
 ) -> acp.PromptResponse | None:
-    text = question.strip()
-    if not text.startswith("/"):
-        return None
-
-    command, _, raw_args = text.partition(" ")
-    normalized = command.lower().replace("-", "")
-    if normalized != "/contenttype":
-        return None
-
-    value = raw_args.strip().lower()
+    parts = question.split(maxsplit=1)
+    value = parts[1].strip().lower() if len(parts) > 1 else ""
     if not value:
         active = _resolve_content_type(state)
         source = "sessão" if state.content_type_override is not None else "env"
@@ -1228,7 +1780,7 @@ async def _handle_content_type_command(
     elif value in VALID_CONTENT_TYPES:
         state.content_type_override = value
         reply = f"contentType atualizado para: {value}"
-    elif value in {"reset", "default"}:
+    elif value in RESET_VALUES:
         state.content_type_override = None
         reply = "contentType resetado para o valor do ambiente."
     else:
@@ -1239,6 +1791,31 @@ async def _handle_content_type_command(
     return acp.PromptResponse(stop_reason="end_turn")
 
 
+# Chave: primeiro token do prompt em minúsculas e sem hífen (ex.: /content-type -> /contenttype).
+# Os handlers assumem que o token já foi validado aqui e só interpretam os argumentos.
+_COMMAND_HANDLERS: dict[
+    str,
+    Callable[
+        [acp.Client | None, str, SessionState, str],
+        Awaitable[acp.PromptResponse | None],
+    ],
+] = {
+    "/config": _handle_config_command,
+    "/memory": _handle_memory_command,
+    "/repo": _handle_repo_command,
+    "/model": _handle_model_command,
+    "/grounded": _handle_grounded_command,
+    "/knowledge": _handle_knowledge_command,
+    "/contenttype": _handle_content_type_command,
+}
+
+
+# Comandos que mexem em overrides usados pelo template do payload do ask_code.
+PAYLOAD_OVERRIDE_COMMANDS: frozenset[str] = frozenset(
+    {"/repo", "/model", "/grounded", "/knowledge", "/contenttype"}
+)
+
+
 def _resolve_environment() -> str:
     return os.getenv("ACP_ENVIRONMENT", "").strip() or "local"
 
@@ -1383,7 +1960,7 @@ def _hydrate_local_session_context(state: SessionState) -> None:
         app_name=app_name,
         environment=environment,
         session_id=state.session_id,
-        limit=max(50, _resolve_memory_max_turns() * 4),
+        limit=max(50, state.cfg.memory_max_turns * 4),
     )
     if not turns:
         return
@@ -1397,7 +1974,7 @@ def _hydrate_local_session_context(state: SessionState) -> None:
         if turn.role == "assistant" and current_user:
             history.append((current_user, turn.content))
             current_user = None
-    state.conversation_history = history[-max(32, _resolve_memory_max_turns() * 3) :]
+    state.conversation_history = history[-max(32, state.cfg.memory_max_turns * 3) :]
 
 
 def _parse_bool_value(value: str) -> bool | None:
@@ -1508,4 +2085,5 @@ def _build_session_config_options(state: SessionState) -> list[acp_schema.Sessio
 
 
 def _random_session_id() -> str:
-    return f"session-{os.urandom(6).hex()}"
+    # Prefixo aleatório por processo + contador: IDs únicos sem syscall por sessão.
+    return _SESSION_ID_PREFIX + format(next(_session_id_counter), "x")
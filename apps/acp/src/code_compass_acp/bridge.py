@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import itertools
 import json
 import os
+import re
 import shlex
 import signal
 import sys
@@ -10,7 +13,22 @@ from collections import deque
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
-from uuid import uuid4
+
+from . import json_codec
+
+# Respostas do ask_code (com contexto/evidências) podem ser grandes; o limite padrão de 64 KiB
+# do StreamReader estouraria no readline.
+MCP_STDOUT_LIMIT_BYTES = 16 * 1024 * 1024
+# Bytes guardados do início e do fim de uma linha acima do limite, para achar o id dela.
+OVERSIZED_LINE_EDGE_BYTES = 256
+# Teto de tool calls em andamento por subprocesso (compartilhado entre sessões).
+MCP_MAX_PENDING_REQUESTS = 64
+STDERR_EXCERPT_MAX_CHARS = 1200
+STDERR_SEPARATOR = " | "
+
+# O id de uma resposta JSON-RPC costuma vir no fim (SDK TS) ou logo após o "jsonrpc".
+_RESPONSE_ID_AT_END = re.compile(rb'"id"\s*:\s*(\d+)\s*\}\s*$')
+_RESPONSE_ID_AT_START = re.compile(rb'^\s*\{\s*"jsonrpc"\s*:\s*"2\.0"\s*,\s*"id"\s*:\s*(\d+)')
 
 
 @dataclass
@@ -28,24 +46,32 @@ class McpBridge:
         self._stderr_task: asyncio.Task[None] | None = None
         self._stderr_tail: deque[str] = deque(maxlen=30)
         self._pending: dict[str | int, asyncio.Future[dict[str, Any]]] = {}
+        # Ids 1 e 2 são do handshake; os requests seguem em sequência.
+        self._request_ids = itertools.count(3)
+        self._env: dict[str, str] | None = None
+        # O bridge pode ser compartilhado entre sessões: start/close não podem se intercalar
+        # (um segundo start não pode escrever antes do handshake do primeiro terminar).
+        self._start_lock = asyncio.Lock()
 
-    async def start(self) -> None:
-        if self._process and self._process.returncode is None:
-            return
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
 
-        env = os.environ.copy()
-        if self._config.llm_model:
-            env["LLM_MODEL"] = self._config.llm_model
-        if self._config.env_overrides:
-            env.update(self._config.env_overrides)
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self.is_alive:
+                return
+            await self._spawn()
 
+    async def _spawn(self) -> None:
         self._stderr_tail.clear()
         self._process = await asyncio.create_subprocess_exec(
             *self._config.command,
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
-            env=env,
+            env=self._subprocess_env(),
+            limit=MCP_STDOUT_LIMIT_BYTES,
         )
 
         self._reader_task = asyncio.create_task(self._read_loop())
@@ -56,6 +82,17 @@ class McpBridge:
             await self.abort()
             raise
 
+    def _subprocess_env(self) -> dict[str, str]:
+        # Montado no primeiro start e reaproveitado nos restarts (idle reaper, MCP que caiu).
+        if self._env is None:
+            env = os.environ.copy()
+            if self._config.llm_model:
+                env["LLM_MODEL"] = self._config.llm_model
+            if self._config.env_overrides:
+                env.update(self._config.env_overrides)
+            self._env = env
+        return self._env
+
     async def ask_code(
         self,
         arguments: dict[str, Any],
@@ -63,8 +100,13 @@ class McpBridge:
     ) -> dict[str, Any]:
         await self.start()
 
-        req_id = str(uuid4())
-        future: asyncio.Future[dict[str, Any]] = asyncio.get_event_loop().create_future()
+        if len(self._pending) >= MCP_MAX_PENDING_REQUESTS:
+            raise RuntimeError(
+                f"MCP com {len(self._pending)} requests em andamento; tente novamente em instantes."
+            )
+
+        req_id = next(self._request_ids)
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
         self._pending[req_id] = future
 
         request = {
@@ -73,19 +115,34 @@ class McpBridge:
             "method": "tools/call",
             "params": {"name": "ask_code", "arguments": arguments},
         }
-        await self._write(request)
-
-        cancel_task = asyncio.create_task(cancel_event.wait())
-        done, _ = await asyncio.wait(
-            [future, cancel_task],
-            return_when=asyncio.FIRST_COMPLETED,
-        )
+        try:
+            await self._write(request)
+            cancel_task = asyncio.create_task(cancel_event.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    [future, cancel_task],
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                cancel_task.cancel()
+        finally:
+            # Respostas já saem do _pending no _read_loop; isto cobre cancelamento e falha
+            # de escrita, para nenhum future ficar órfão no dict.
+            self._pending.pop(req_id, None)
 
         if cancel_task in done:
-            await self.abort()
+            # Descarta só este request; o subprocesso segue atendendo as demais sessões.
+            # O notifications/cancelled do MCP deixa o servidor interromper o trabalho em curso.
+            with contextlib.suppress(RuntimeError, OSError):
+                await self._write(
+                    {
+                        "jsonrpc": "2.0",
+                        "method": "notifications/cancelled",
+                        "params": {"requestId": req_id, "reason": "Cancelado pelo cliente ACP"},
+                    }
+                )
             raise asyncio.CancelledError()
 
-        cancel_task.cancel()
         response = future.result()
         return self._parse_tools_call_result(response)
 
@@ -101,7 +158,19 @@ class McpBridge:
                 self._process.kill()
         await self._close_io()
 
+    def terminate(self) -> None:
+        # Encerramento síncrono para o atexit: o loop dono do subprocesso já pode ter fechado,
+        # então não há como aguardar o processo; só envia o SIGTERM.
+        process = self._process
+        if process is not None and process.returncode is None:
+            with contextlib.suppress(ProcessLookupError, RuntimeError):
+                process.terminate()
+
     async def close(self) -> None:
+        async with self._start_lock:
+            await self._shutdown()
+
+    async def _shutdown(self) -> None:
         if not self._process:
             return
 
@@ -145,50 +214,87 @@ class McpBridge:
         if req_id is None:
             raise RuntimeError("Request MCP sem id")
 
-        future: asyncio.Future[dict[str, Any]] = asyncio.get_event_loop().create_future()
+        future: asyncio.Future[dict[str, Any]] = asyncio.get_running_loop().create_future()
         self._pending[req_id] = future
-        await self._write(payload)
-        return await future
+        try:
+            await self._write(payload)
+            return await future
+        finally:
+            self._pending.pop(req_id, None)
 
     async def _write(self, payload: dict[str, Any]) -> None:
         if not self._process or not self._process.stdin:
             raise RuntimeError("Processo MCP não inicializado")
 
-        line = json.dumps(payload, ensure_ascii=False)
-        self._process.stdin.write(f"{line}\n".encode("utf-8"))
+        self._process.stdin.write(json_codec.dumps_bytes(payload) + b"\n")
         await self._process.stdin.drain()
 
     async def _read_loop(self) -> None:
-        if not self._process or not self._process.stdout:
+        process = self._process
+        if not process or not process.stdout:
             return
 
-        buffer = b""
+        stdout = process.stdout
         try:
             while True:
-                chunk = await self._process.stdout.read(4096)
-                if not chunk:
+                try:
+                    line = await stdout.readuntil(b"\n")
+                except asyncio.IncompleteReadError as exc:
+                    # EOF: entrega um eventual resto sem "\n" e encerra.
+                    self._dispatch_line(exc.partial)
                     break
-                buffer += chunk
-                while b"\n" in buffer:
-                    line, buffer = buffer.split(b"\n", 1)
-                    if not line.strip():
-                        continue
-                    try:
-                        msg = json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
-                    msg_id = msg.get("id")
-                    if msg_id in self._pending:
-                        future = self._pending.pop(msg_id)
-                        if not future.done():
-                            future.set_result(msg)
+                except asyncio.LimitOverrunError as exc:
+                    await self._drop_oversized_line(stdout, exc.consumed)
+                    continue
+                self._dispatch_line(line)
         except asyncio.CancelledError:
             return
         except Exception as exc:
             self._fail_pending(exc)
         finally:
-            self._fail_pending(self._build_process_exit_error("MCP encerrou stdout"))
-            self._process = None
+            # Num restart (close + start), o reader antigo pode terminar depois do spawn do
+            # novo processo: só limpa pendências e handle se ainda forem deste processo.
+            if self._process is process:
+                self._fail_pending(self._build_process_exit_error("MCP encerrou stdout"))
+                self._process = None
+
+    def _dispatch_line(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            msg = json_codec.loads(line)
+        except json.JSONDecodeError:
+            return
+        msg_id = msg.get("id")
+        if msg_id in self._pending:
+            future = self._pending.pop(msg_id)
+            if not future.done():
+                future.set_result(msg)
+
+    async def _drop_oversized_line(self, stdout: asyncio.StreamReader, consumed: int) -> None:
+        # Linha acima do limite do StreamReader: descarta-a em blocos até o "\n" e falha só o
+        # request dela; o reader e os demais requests seguem vivos.
+        head = await stdout.read(consumed)
+        tail = head[-OVERSIZED_LINE_EDGE_BYTES:]
+        head = head[:OVERSIZED_LINE_EDGE_BYTES]
+        while True:
+            try:
+                chunk = await stdout.readuntil(b"\n")
+            except asyncio.LimitOverrunError as exc:
+                chunk = await stdout.read(exc.consumed)
+                tail = (tail + chunk)[-OVERSIZED_LINE_EDGE_BYTES:]
+                continue
+            except asyncio.IncompleteReadError as exc:
+                chunk = exc.partial
+            tail = (tail + chunk)[-OVERSIZED_LINE_EDGE_BYTES:]
+            break
+
+        match = _RESPONSE_ID_AT_END.search(tail) or _RESPONSE_ID_AT_START.match(head)
+        future = self._pending.pop(int(match.group(1)), None) if match else None
+        if future is not None and not future.done():
+            future.set_exception(
+                RuntimeError(f"Resposta MCP excede o limite de {MCP_STDOUT_LIMIT_BYTES} bytes")
+            )
 
     async def _read_stderr_loop(self) -> None:
         if not self._process or not self._process.stderr:
@@ -212,10 +318,7 @@ class McpBridge:
         if self._process and self._process.returncode is not None:
             details.append(f"exit={self._process.returncode}")
         if self._stderr_tail:
-            stderr_excerpt = " | ".join(self._stderr_tail)
-            if len(stderr_excerpt) > 1200:
-                stderr_excerpt = f"...{stderr_excerpt[-1200:]}"
-            details.append(f"stderr={stderr_excerpt}")
+            details.append(f"stderr={_stderr_excerpt(self._stderr_tail)}")
         if details:
             return RuntimeError(f"{message} ({'; '.join(details)})")
         return RuntimeError(message)
@@ -255,7 +358,7 @@ class McpBridge:
             raise RuntimeError(text)
 
         try:
-            output = json.loads(text)
+            output = json_codec.loads(text)
         except json.JSONDecodeError as exc:
             raise RuntimeError("Resposta MCP sem JSON válido") from exc
 
@@ -265,6 +368,22 @@ class McpBridge:
         return output
 
 
+def _stderr_excerpt(lines: deque[str], max_chars: int = STDERR_EXCERPT_MAX_CHARS) -> str:
+    # Junta só as linhas finais necessárias para cobrir max_chars (mesmo resultado de juntar
+    # tudo e cortar o fim), sem montar a string completa do stderr.
+    parts: list[str] = []
+    size = -len(STDERR_SEPARATOR)
+    for line in reversed(lines):
+        parts.append(line)
+        size += len(STDERR_SEPARATOR) + len(line)
+        if size > max_chars:
+            break
+    excerpt = STDERR_SEPARATOR.join(reversed(parts))
+    if len(excerpt) > max_chars:
+        return f"...{excerpt[-max_chars:]}"
+    return excerpt
+
+
 def resolve_mcp_command() -> list[str]:
     raw_command = os.getenv("MCP_COMMAND", "").strip()
     if raw_command:
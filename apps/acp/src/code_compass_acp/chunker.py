@@ -1,110 +1,94 @@
 from __future__ import annotations
 
 import re
+from collections.abc import Iterator
+
+_PARAGRAPH_SEPARATOR = re.compile(r"\n\n+")
+
 
 def chunk_by_paragraph(text: str, max_size: int = 300) -> list[str]:
+    return list(iter_paragraph_chunks(text, max_size=max_size))
+
+
+def iter_paragraph_chunks(text: str, max_size: int = 300) -> Iterator[str]:
+    # Versão lazy de chunk_by_paragraph: o primeiro chunk sai antes do split completo.
     # Ignore respostas compostas apenas por whitespace para evitar updates vazios no stream.
     if not text or not text.strip():
-        return []
-    if max_size <= 0:
-        return [text]
-    if len(text) <= max_size:
-        return [text]
-
-    paragraphs = _split_paragraphs(text)
-    if not paragraphs:
-        return [text]
+        return
+    if max_size <= 0 or len(text) <= max_size:
+        yield text
+        return
 
-    chunks: list[str] = []
-    current = ""
+    # Acumula partes e o tamanho somado; o chunk só é montado (um join) quando sai.
+    parts: list[str] = []
+    size = 0
 
-    for paragraph in paragraphs:
+    for paragraph in _iter_paragraphs(text):
         if len(paragraph) > max_size:
-            if current:
-                chunks.append(current)
-                current = ""
-            chunks.extend(_split_long_paragraph(paragraph, max_size=max_size))
+            if parts:
+                yield "".join(parts)
+                parts = []
+                size = 0
+            yield from _iter_long_paragraph(paragraph, max_size=max_size)
             continue
 
-        if not current:
-            current = paragraph
-            continue
+        if parts and size + len(paragraph) > max_size:
+            yield "".join(parts)
+            parts = []
+            size = 0
+        parts.append(paragraph)
+        size += len(paragraph)
 
-        candidate = f"{current}{paragraph}"
-        if len(candidate) > max_size:
-            chunks.append(current)
-            current = paragraph
-        else:
-            current = candidate
+    if parts:
+        yield "".join(parts)
 
-    if current:
-        chunks.append(current)
 
-    return chunks
-
-
-def _split_paragraphs(text: str) -> list[str]:
-    # Keep `\n\n...` separators interleaved for non-whitespace segments.
+def _iter_paragraphs(text: str) -> Iterator[str]:
+    # Each paragraph keeps its trailing `\n\n...` separator.
     # Whitespace-only segments are intentionally descartados para evitar chunks vazios.
-    # `re.split` with a capture group returns separators as odd-indexed entries.
-    parts = re.split(r"(\n\n+)", text)
-    if len(parts) == 1:
-        return [text]
-
-    paragraphs: list[str] = []
-    index = 0
-    total = len(parts)
-
-    while index < total:
-        piece = parts[index]
-        separator = parts[index + 1] if index + 1 < total else ""
-        combined = f"{piece}{separator}"
+    start = 0
+    for match in _PARAGRAPH_SEPARATOR.finditer(text):
+        end = match.end()
+        combined = text[start:end]
+        start = end
         if combined.strip():
-            paragraphs.append(combined)
-        index += 2
+            yield combined
 
-    return paragraphs
+    tail = text[start:]
+    if tail.strip():
+        yield tail
 
 
-def _split_long_paragraph(paragraph: str, *, max_size: int) -> list[str]:
+def _iter_long_paragraph(paragraph: str, *, max_size: int) -> Iterator[str]:
     if len(paragraph) <= max_size:
-        return [paragraph]
-
-    lines = paragraph.splitlines(keepends=True)
-    if not lines:
-        return _split_long_text(paragraph, max_size=max_size)
-
-    chunks: list[str] = []
-    current = ""
-    for line in lines:
-        if len(line) > max_size:
-            if current:
-                chunks.append(current)
-                current = ""
-            chunks.extend(_split_long_text(line, max_size=max_size))
+        yield paragraph
+        return
+
+    # Varredura por índices: cada chunk é um slice contíguo `paragraph[start:end]`, sem lista
+    # de linhas nem concatenações intermediárias.
+    length = len(paragraph)
+    start = end = 0
+    while end < length:
+        newline = paragraph.find("\n", end)
+        line_end = length if newline == -1 else newline + 1
+        if line_end - end > max_size:
+            if start < end:
+                yield paragraph[start:end]
+            yield from _iter_long_text(paragraph[end:line_end], max_size=max_size)
+            start = end = line_end
             continue
 
-        # Defensive invariant: oversized lines are handled in the branch above.
-        assert len(line) <= max_size
-        candidate = f"{current}{line}"
-        if len(candidate) > max_size and current:
-            chunks.append(current)
-            current = line
-        else:
-            current = candidate
+        if start < end and line_end - start > max_size:
+            yield paragraph[start:end]
+            start = end
+        end = line_end
         # Keep the accumulator bounded even if this loop is refactored later.
-        assert len(current) <= max_size
+        assert end - start <= max_size
 
-    if current:
-        chunks.append(current)
+    if start < end:
+        yield paragraph[start:end]
 
-    return chunks
 
-
-def _split_long_text(text: str, *, max_size: int) -> list[str]:
-    chunks: list[str] = []
-    start = 0
-    while start < len(text):
-        chunks.append(text[start : start + max_size])
-        start += max_size
-    return chunks
+def _iter_long_text(text: str, *, max_size: int) -> Iterator[str]:
+    for start in range(0, len(text), max_size):
+        yield text[start : start + max_size]
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ModuleNotFoundError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+def dumps(value: Any, *, indent: bool = False) -> str:
+    """Serializa em JSON UTF-8 (sem escape ASCII); usa orjson quando disponível.
+
+    Compacto por padrão; com ``indent=True`` usa indentação de 2 espaços.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(value, ensure_ascii=False, indent=2)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(value: Any) -> bytes:
+    """Serializa em JSON UTF-8 compacto já como bytes (pronto para escrever em pipes)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Desserializa JSON; erros sobem como ``json.JSONDecodeError`` nos dois backends."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
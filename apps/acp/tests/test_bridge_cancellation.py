@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from code_compass_acp.bridge import McpBridge, McpBridgeConfig
+
+
+class _Stdin:
+    def __init__(self) -> None:
+        self.lines: list[dict[str, object]] = []
+
+    def write(self, data: bytes) -> None:
+        self.lines.append(json.loads(data))
+
+    async def drain(self) -> None:
+        return
+
+    def is_closing(self) -> bool:
+        return False
+
+
+def _running_bridge() -> tuple[McpBridge, _Stdin]:
+    bridge = McpBridge(McpBridgeConfig(command=["unused"]))
+    stdin = _Stdin()
+    bridge._process = type("Proc", (), {"returncode": None, "stdin": stdin})()  # type: ignore[attr-defined]
+    return bridge, stdin
+
+
+def test_cancel_notifies_server_and_keeps_process() -> None:
+    async def run() -> None:
+        bridge, stdin = _running_bridge()
+        cancelled = asyncio.Event()
+        sibling = asyncio.Event()
+
+        first = asyncio.create_task(bridge.ask_code({"query": "a"}, cancelled))
+        second = asyncio.create_task(bridge.ask_code({"query": "b"}, sibling))
+        await asyncio.sleep(0)
+        cancelled.set()
+        result = await asyncio.gather(first, return_exceptions=True)
+
+        assert isinstance(result[0], asyncio.CancelledError)
+        assert bridge.is_alive
+        first_id = stdin.lines[0]["id"]
+        notification = stdin.lines[-1]
+        assert notification["method"] == "notifications/cancelled"
+        assert notification["params"]["requestId"] == first_id  # type: ignore[index]
+        assert list(bridge._pending) == [stdin.lines[1]["id"]]  # type: ignore[attr-defined]
+
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        assert not bridge._pending  # type: ignore[attr-defined]
+
+    asyncio.run(run())
+
+
+def test_ask_code_rejects_when_too_many_requests_are_pending() -> None:
+    from code_compass_acp import bridge as bridge_mod
+
+    async def run() -> None:
+        bridge, stdin = _running_bridge()
+        loop = asyncio.get_running_loop()
+        for req_id in range(bridge_mod.MCP_MAX_PENDING_REQUESTS):
+            bridge._pending[req_id] = loop.create_future()  # type: ignore[attr-defined]
+
+        with pytest.raises(RuntimeError, match="requests em andamento"):
+            await bridge.ask_code({"query": "a"}, asyncio.Event())
+        assert stdin.lines == []
+
+    asyncio.run(run())
+
+
+def test_ask_code_drops_pending_entry_when_write_fails() -> None:
+    async def run() -> None:
+        bridge, stdin = _running_bridge()
+
+        def broken_write(data: bytes) -> None:
+            raise BrokenPipeError("stdin fechado")
+
+        stdin.write = broken_write  # type: ignore[method-assign]
+        with pytest.raises(BrokenPipeError):
+            await bridge.ask_code({"query": "a"}, asyncio.Event())
+        assert not bridge._pending  # type: ignore[attr-defined]
+
+    asyncio.run(run())
+
+
+def test_stale_reader_does_not_clobber_restarted_process() -> None:
+    async def run() -> None:
+        bridge, _stdin = _running_bridge()
+        old_stdout = asyncio.StreamReader()
+        bridge._process.stdout = old_stdout  # type: ignore[union-attr]
+        old_reader = asyncio.create_task(bridge._read_loop())  # type: ignore[attr-defined]
+        await asyncio.sleep(0)
+
+        # Restart: o close cancela o reader antigo e o start sobe outro processo antes de o
+        # cancelamento ser processado.
+        old_reader.cancel()
+        new_process = type("Proc", (), {"returncode": None, "stdin": _Stdin()})()
+        bridge._process = new_process  # type: ignore[attr-defined]
+        future = asyncio.get_running_loop().create_future()
+        bridge._pending[3] = future  # type: ignore[attr-defined]
+        await asyncio.gather(old_reader, return_exceptions=True)
+
+        assert bridge._process is new_process  # type: ignore[attr-defined]
+        assert bridge._pending == {3: future}  # type: ignore[attr-defined]
+        assert not future.done()
+
+    asyncio.run(run())
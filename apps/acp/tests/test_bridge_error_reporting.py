@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import asyncio
+
+import pytest
+
 from code_compass_acp.bridge import McpBridge, McpBridgeConfig
 
 
@@ -27,3 +31,50 @@ def test_process_exit_error_without_details() -> None:
     error = bridge._build_process_exit_error("MCP encerrou stdout")  # type: ignore[attr-defined]
 
     assert str(error) == "MCP encerrou stdout"
+
+
+def test_is_alive_tracks_process_returncode() -> None:
+    bridge = _bridge()
+    assert not bridge.is_alive
+
+    bridge._process = type("Proc", (), {"returncode": None})()  # type: ignore[attr-defined]
+    assert bridge.is_alive
+
+    bridge._process = type("Proc", (), {"returncode": 0})()  # type: ignore[attr-defined]
+    assert not bridge.is_alive
+
+
+def test_process_exit_error_keeps_only_the_stderr_tail() -> None:
+    bridge = _bridge()
+    bridge._stderr_tail.extend(f"{index:02d}" + "x" * 98 for index in range(30))  # type: ignore[attr-defined]
+    bridge._process = type("Proc", (), {"returncode": 1})()  # type: ignore[attr-defined]
+
+    message = str(bridge._build_process_exit_error("MCP encerrou stdout"))  # type: ignore[attr-defined]
+
+    excerpt = message.split("stderr=", 1)[1].rstrip(")")
+    assert excerpt.startswith("...")
+    assert len(excerpt) == 3 + 1200
+    assert excerpt.endswith("29" + "x" * 98)
+    assert "00xxx" not in excerpt
+
+
+def test_oversized_stdout_line_fails_only_its_request() -> None:
+    async def run() -> None:
+        bridge = _bridge()
+        stdout = asyncio.StreamReader(limit=64)
+        bridge._process = type("Proc", (), {"returncode": None, "stdout": stdout})()  # type: ignore[attr-defined]
+        loop = asyncio.get_running_loop()
+        oversized = loop.create_future()
+        sibling = loop.create_future()
+        bridge._pending.update({3: oversized, 4: sibling})  # type: ignore[attr-defined]
+
+        stdout.feed_data(b'{"result":{"text":"' + b"x" * 500 + b'"},"jsonrpc":"2.0","id":3}\n')
+        stdout.feed_data(b'{"jsonrpc":"2.0","id":4,"result":{}}\n')
+        stdout.feed_eof()
+        await bridge._read_loop()  # type: ignore[attr-defined]
+
+        with pytest.raises(RuntimeError, match="excede o limite"):
+            oversized.result()
+        assert sibling.result() == {"jsonrpc": "2.0", "id": 4, "result": {}}
+
+    asyncio.run(run())
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import pytest
 
-from code_compass_acp.chunker import chunk_by_paragraph
+from code_compass_acp.chunker import chunk_by_paragraph, iter_paragraph_chunks
 
 
 def test_chunker_returns_empty_for_empty_text() -> None:
@@ -75,3 +75,12 @@ def test_split_long_paragraph_preserves_size_invariant() -> None:
     assert chunks
     assert "".join(chunks) == paragraph
     assert all(0 < len(chunk) <= 4 for chunk in chunks)
+
+
+def test_iter_paragraph_chunks_is_lazy_and_matches_list_api() -> None:
+    text = "Primeiro paragrafo.\n\nSegundo paragrafo.\n\nTerceiro."
+
+    chunks = iter_paragraph_chunks(text, max_size=24)
+
+    assert next(chunks) == "Primeiro paragrafo.\n\n"
+    assert ["Primeiro paragrafo.\n\n", *chunks] == chunk_by_paragraph(text, max_size=24)
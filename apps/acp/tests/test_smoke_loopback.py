@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import json
 from pathlib import Path
+from typing import Any
 
 import pytest
 
@@ -15,6 +16,16 @@ class DummyBridge:
         self.fail_with = fail_with
         self.aborted = False
         self.calls: list[dict[str, object]] = []
+        self.started = asyncio.Event()
+        self._alive = True
+
+    @property
+    def is_alive(self) -> bool:
+        return self._alive
+
+    @is_alive.setter
+    def is_alive(self, value: bool) -> None:
+        self._alive = value
 
     async def start(self) -> None:  # pragma: no cover - interface parity
         return
@@ -25,6 +36,7 @@ class DummyBridge:
         self.calls.append(dict(arguments))
         if self.fail_with is not None:
             raise self.fail_with
+        self.started.set()
         if self.delay:
             await asyncio.sleep(self.delay)
         if cancel_event.is_set():
@@ -37,10 +49,13 @@ class DummyBridge:
     async def close(self) -> None:
         return
 
+    def terminate(self) -> None:
+        return
+
 
 class DummyConn:
     def __init__(self) -> None:
-        self.updates: list[tuple[str, str]] = []
+        self.updates: list[str] = []
         self.raw_updates: list[tuple[str, object]] = []
 
     async def session_update(self, session_id: str, update: object) -> None:
@@ -50,7 +65,12 @@ class DummyConn:
         if not isinstance(text, str):
             fallback = getattr(update, "text", "")
             text = fallback if isinstance(fallback, str) else ""
-        self.updates.append((session_id, text))
+        self.updates.append(text)
+
+
+def _joined_text(conn: DummyConn) -> str:
+    # Um único texto para asserts de substring, em vez de varrer os updates a cada assert.
+    return "\n".join(conn.updates)
 
 
 def _extract_config_payload(text: str) -> dict[str, object]:
@@ -133,6 +153,55 @@ def test_prompt_receives_updates(monkeypatch: pytest.MonkeyPatch) -> None:
     asyncio.run(run())
 
 
+def test_prompt_emits_meta_marker_before_answer(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    class MetaBridge(DummyBridge):
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            self.calls.append(dict(arguments))
+            return {
+                "answer": "Resposta",
+                "meta": {"model": "ção"},
+                "evidences": [{"path": "src/a.py"}],
+            }
+
+    dummy = MetaBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_SHOW_META", "1")
+    monkeypatch.setenv("ACP_SHOW_CONTEXT", "1")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        conn.updates.clear()
+        response = await agent.prompt(
+            acp.PromptRequest(
+                prompt=[acp.text_block("Pergunta")],
+                session_id=session.session_id,
+            )
+        )
+
+        assert response.stop_reason == "end_turn"
+        marker = "__ACP_META__"
+        # A linha de meta sai em um update próprio, antes do texto da resposta.
+        assert len(conn.updates) == 2
+        meta_text = conn.updates[0]
+        assert meta_text.startswith(marker)
+        assert "ção" in meta_text
+        assert json.loads(meta_text[len(marker) :]) == {
+            "meta": {"model": "ção"},
+            "evidences": [{"path": "src/a.py"}],
+        }
+        assert conn.updates[1] == "Resposta"
+
+    asyncio.run(run())
+
+
 def test_prompt_preserves_conversation_context_between_turns(
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
@@ -316,7 +385,7 @@ def test_memory_command_list_and_toggle(monkeypatch: pytest.MonkeyPatch) -> None
             )
         )
         assert list_response.stop_reason == "end_turn"
-        assert any("Memórias do escopo atual" in text for _, text in conn.updates)
+        assert "Memórias do escopo atual" in _joined_text(conn)
 
         disable_response = await agent.prompt(
             acp.PromptRequest(
@@ -333,7 +402,7 @@ def test_memory_command_list_and_toggle(monkeypatch: pytest.MonkeyPatch) -> None
 def test_cancel_during_mcp_wait(monkeypatch: pytest.MonkeyPatch) -> None:
     from code_compass_acp import agent as agent_mod
 
-    dummy = DummyBridge(delay=0.2)
+    dummy = DummyBridge(delay=0.01)
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
     async def run() -> None:
@@ -352,20 +421,20 @@ def test_cancel_during_mcp_wait(monkeypatch: pytest.MonkeyPatch) -> None:
             )
 
         task = asyncio.create_task(do_prompt())
-        await asyncio.sleep(0.05)
+        await dummy.started.wait()
         await agent.cancel(session_id=session.session_id)
         response = await task
 
         assert response.stop_reason == "cancelled"
-        assert dummy.aborted
+        assert not dummy.aborted
 
     asyncio.run(run())
 
 
-def test_prompt_surfaces_mcp_error(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_cancel_is_not_lost_when_a_new_prompt_starts(monkeypatch: pytest.MonkeyPatch) -> None:
     from code_compass_acp import agent as agent_mod
 
-    dummy = DummyBridge(fail_with=RuntimeError("falha de teste"))
+    dummy = DummyBridge(delay=0.05)
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
     async def run() -> None:
@@ -374,6 +443,145 @@ def test_prompt_surfaces_mcp_error(monkeypatch: pytest.MonkeyPatch) -> None:
         agent.on_connect(conn)  # type: ignore[arg-type]
 
         session = await agent.new_session(cwd=".", mcpServers=[])
+
+        async def do_prompt(question: str) -> acp.PromptResponse:
+            return await agent.prompt(
+                acp.PromptRequest(
+                    prompt=[acp.text_block(question)],
+                    session_id=session.session_id,
+                )
+            )
+
+        first = asyncio.create_task(do_prompt("Primeira"))
+        await dummy.started.wait()
+        await agent.cancel(session_id=session.session_id)
+        # O segundo prompt começa enquanto o primeiro ainda aguarda o MCP.
+        second = asyncio.create_task(do_prompt("Segunda"))
+
+        first_response, second_response = await asyncio.gather(first, second)
+
+        assert first_response.stop_reason == "cancelled"
+        assert second_response.stop_reason == "end_turn"
+        assert [call["query"] for call in dummy.calls] == ["Primeira", "Segunda"]
+        assert agent._sessions[session.session_id].cancel_events == set()
+
+    asyncio.run(run())
+
+
+def test_cancel_during_streaming_stops_chunks_in_order(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    paragraphs = [f"Paragrafo {index} " + "x" * 280 for index in range(8)]
+
+    class LongAnswerBridge(DummyBridge):
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            self.calls.append(dict(arguments))
+            return {"answer": "\n\n".join(paragraphs)}
+
+    dummy = LongAnswerBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_TEST_SLOW_STREAM", "0.05")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        conn.updates.clear()
+
+        task = asyncio.create_task(
+            agent.prompt(
+                acp.PromptRequest(
+                    prompt=[acp.text_block("Pergunta")],
+                    session_id=session.session_id,
+                )
+            )
+        )
+        await asyncio.sleep(0.12)
+        await agent.cancel(session_id=session.session_id)
+        response = await task
+
+        assert response.stop_reason == "cancelled"
+        streamed = list(conn.updates)
+        assert 0 < len(streamed) < len(paragraphs)
+        assert streamed[0].startswith("Paragrafo 0 ")
+        assert [text.strip() for text in streamed] == [
+            paragraph.strip() for paragraph in paragraphs[: len(streamed)]
+        ]
+
+    asyncio.run(run())
+
+
+def test_cancel_interrupts_slow_stream_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    class TwoParagraphBridge(DummyBridge):
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            return {"answer": "a" * 280 + "\n\n" + "b" * 280}
+
+    dummy = TwoParagraphBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_TEST_SLOW_STREAM", "5")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        conn.updates.clear()
+
+        task = asyncio.create_task(
+            agent.prompt(
+                acp.PromptRequest(
+                    prompt=[acp.text_block("Pergunta")],
+                    session_id=session.session_id,
+                )
+            )
+        )
+        await asyncio.sleep(0.05)
+        await agent.cancel(session_id=session.session_id)
+        response = await asyncio.wait_for(task, timeout=1)
+
+        assert response.stop_reason == "cancelled"
+        assert len(conn.updates) == 1
+
+    asyncio.run(run())
+
+
+def test_stream_coalesce_merges_chunks_without_losing_text(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+    from code_compass_acp.chunker import chunk_by_paragraph
+
+    answer = "\n\n".join(f"Paragrafo {index} " + "x" * 200 for index in range(10))
+
+    class LongAnswerBridge(DummyBridge):
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            self.calls.append(dict(arguments))
+            return {"answer": answer}
+
+    dummy = LongAnswerBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_STREAM_COALESCE_MS", "20")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        conn.updates.clear()
         response = await agent.prompt(
             acp.PromptRequest(
                 prompt=[acp.text_block("Pergunta")],
@@ -382,23 +590,243 @@ def test_prompt_surfaces_mcp_error(monkeypatch: pytest.MonkeyPatch) -> None:
         )
 
         assert response.stop_reason == "end_turn"
-        assert conn.updates
-        assert any("Falha ao consultar o MCP." in text for _, text in conn.updates)
-        assert any("falha de teste" in text for _, text in conn.updates)
+        streamed = list(conn.updates)
+        assert "".join(streamed) == answer
+        assert len(streamed) < len(chunk_by_paragraph(answer))
 
     asyncio.run(run())
 
 
-def test_repo_command_accepts_csv(monkeypatch: pytest.MonkeyPatch) -> None:
+def test_prompt_lock_is_released_during_mcp_wait(monkeypatch: pytest.MonkeyPatch) -> None:
     from code_compass_acp import agent as agent_mod
 
-    dummy = DummyBridge()
+    class TrackingBridge(DummyBridge):
+        def __init__(self) -> None:
+            super().__init__(delay=0.05)
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                return await super().ask_code(arguments, cancel_event)
+            finally:
+                self.in_flight -= 1
+
+    dummy = TrackingBridge()
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
-    async def fake_repo_exists(repo: str) -> bool:
-        return repo in {"golyzer", "cfi", "ui", "base"}
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        responses = await asyncio.gather(
+            *(
+                agent.prompt(
+                    acp.PromptRequest(
+                        prompt=[acp.text_block(f"Pergunta {index}")],
+                        session_id=session.session_id,
+                    )
+                )
+                for index in range(2)
+            )
+        )
+
+        assert [response.stop_reason for response in responses] == ["end_turn", "end_turn"]
+        assert dummy.max_in_flight == 2
+        # Sem prompts em andamento, o registro não mantém locks da sessão.
+        assert len(agent._locks) == 0
 
-    monkeypatch.setattr(agent_mod, "_repo_exists", fake_repo_exists)
+    asyncio.run(run())
+
+
+def test_exit_cleanup_does_not_keep_agents_alive() -> None:
+    import gc
+    import weakref
+
+    from code_compass_acp import agent as agent_mod
+
+    agent = agent_mod.CodeCompassAgent()
+    assert agent in agent_mod._live_agents
+    ref = weakref.ref(agent)
+    del agent
+    gc.collect()
+
+    assert ref() is None
+
+
+def test_exit_cleanup_without_loop_terminates_bridges_synchronously(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    terminated: list[int] = []
+
+    class TerminatingBridge(DummyBridge):
+        def terminate(self) -> None:
+            terminated.append(id(self))
+
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: TerminatingBridge())
+
+    agent = agent_mod.CodeCompassAgent()
+
+    async def open_sessions() -> None:
+        for _ in range(3):
+            await agent.new_session(cwd=".", mcpServers=[])
+
+    asyncio.run(open_sessions())
+    # Mesma configuração de LLM: as três sessões compartilham um único bridge.
+    assert len({id(state.mcp_bridge) for state in agent._sessions.values()}) == 1
+    agent._cleanup_all_sessions()
+
+    assert len(terminated) == 1
+    assert agent._sessions == {}
+
+
+def test_aclose_closes_bridges_on_running_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    closed: list[int] = []
+
+    class ClosingBridge(DummyBridge):
+        async def close(self) -> None:
+            closed.append(id(asyncio.get_running_loop()))
+
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: ClosingBridge())
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        await agent.new_session(cwd=".", mcpServers=[])
+        await agent.aclose()
+
+        assert closed == [id(asyncio.get_running_loop())]
+        assert agent._sessions == {}
+
+    asyncio.run(run())
+
+
+def test_prewarm_starts_bridge_on_connect_and_first_session_reuses_it(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    class CountingBridge(DummyBridge):
+        def __init__(self) -> None:
+            super().__init__()
+            self.starts = 0
+
+        async def start(self) -> None:
+            self.starts += 1
+
+    built: list[CountingBridge] = []
+
+    def fake_build_bridge(llm_model: str | None = None) -> CountingBridge:
+        bridge = CountingBridge()
+        built.append(bridge)
+        return bridge
+
+    monkeypatch.setattr(agent_mod, "build_bridge", fake_build_bridge)
+    monkeypatch.setenv("ACP_MCP_PREWARM", "true")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        agent.on_connect(DummyConn())  # type: ignore[arg-type]
+        assert agent._warm_task is not None
+        await agent._warm_task
+        warm = built[0]
+        assert warm.starts == 1
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        assert agent._sessions[session.session_id].mcp_bridge is warm
+
+        await agent.aclose()
+        assert len(agent._bridges) == 0
+
+    asyncio.run(run())
+
+
+def test_sessions_share_bridge_until_model_diverges(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    class ClosingBridge(DummyBridge):
+        def __init__(self, llm_model: str | None) -> None:
+            super().__init__()
+            self.llm_model = llm_model
+            self.closed = False
+
+        async def close(self) -> None:
+            self.closed = True
+
+    built: list[ClosingBridge] = []
+
+    def fake_build_bridge(llm_model: str | None = None) -> ClosingBridge:
+        bridge = ClosingBridge(llm_model)
+        built.append(bridge)
+        return bridge
+
+    monkeypatch.setattr(agent_mod, "build_bridge", fake_build_bridge)
+    monkeypatch.setenv("ACP_MODEL_PROFILES_FILE", "missing-profiles.toml")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        first = await agent.new_session(cwd=".", mcpServers=[])
+        second = await agent.new_session(cwd=".", mcpServers=[])
+        shared = agent._sessions[first.session_id].mcp_bridge
+        assert agent._sessions[second.session_id].mcp_bridge is shared
+
+        await agent.prompt(
+            acp.PromptRequest(
+                prompt=[acp.text_block("/model gpt-5")],
+                session_id=first.session_id,
+            )
+        )
+        switched = agent._sessions[first.session_id].mcp_bridge
+        assert switched is not shared
+        assert switched.llm_model == "gpt-5"
+        assert not shared.closed
+
+        await agent.prompt(
+            acp.PromptRequest(
+                prompt=[acp.text_block("/model gpt-5")],
+                session_id=second.session_id,
+            )
+        )
+        assert agent._sessions[second.session_id].mcp_bridge is switched
+        assert shared.closed
+
+    asyncio.run(run())
+
+
+def test_idle_sessions_release_bridge_but_keep_state(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    class ClosingBridge(DummyBridge):
+        def __init__(self) -> None:
+            super().__init__()
+            self.is_alive = True
+            self.close_calls = 0
+
+        async def close(self) -> None:
+            self.close_calls += 1
+            self.is_alive = False
+
+        async def ask_code(
+            self, arguments: dict[str, object], cancel_event: asyncio.Event
+        ) -> dict[str, object]:
+            self.is_alive = True
+            return await super().ask_code(arguments, cancel_event)
+
+    dummy = ClosingBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_SESSION_IDLE_TTL_SECONDS", "0.05")
 
     async def run() -> None:
         agent = agent_mod.CodeCompassAgent()
@@ -406,35 +834,68 @@ def test_repo_command_accepts_csv(monkeypatch: pytest.MonkeyPatch) -> None:
         agent.on_connect(conn)  # type: ignore[arg-type]
 
         session = await agent.new_session(cwd=".", mcpServers=[])
+        await asyncio.sleep(0.2)
+        assert dummy.close_calls == 1
+
         response = await agent.prompt(
             acp.PromptRequest(
-                prompt=[acp.text_block("/repo golyzer,cfi,ui,base")],
+                prompt=[acp.text_block("Pergunta")],
                 session_id=session.session_id,
             )
         )
-
         assert response.stop_reason == "end_turn"
-        assert agent._sessions[session.session_id].repo_override == "golyzer,cfi,ui,base"
-        assert any(
-            "Repos atualizados para: golyzer,cfi,ui,base" in text
-            for _, text in conn.updates
+        assert session.session_id in agent._sessions
+
+        await agent._close_all_sessions()
+
+    asyncio.run(run())
+
+
+def test_prompt_surfaces_mcp_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    dummy = DummyBridge(fail_with=RuntimeError("falha de teste"))
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        response = await agent.prompt(
+            acp.PromptRequest(
+                prompt=[acp.text_block("Pergunta")],
+                session_id=session.session_id,
+            )
         )
 
+        assert response.stop_reason == "end_turn"
+        assert conn.updates
+        text = _joined_text(conn)
+        assert "Falha ao consultar o MCP." in text
+        assert "falha de teste" in text
+
     asyncio.run(run())
 
 
-def test_repo_command_rejects_csv_with_unknown_repo(
-    monkeypatch: pytest.MonkeyPatch,
+@pytest.mark.parametrize(("alive", "expect_closed"), [(True, False), (False, True)])
+def test_prompt_error_closes_bridge_only_when_mcp_is_dead(
+    monkeypatch: pytest.MonkeyPatch, alive: bool, expect_closed: bool
 ) -> None:
     from code_compass_acp import agent as agent_mod
 
-    dummy = DummyBridge()
-    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    class FailingBridge(DummyBridge):
+        def __init__(self) -> None:
+            super().__init__(fail_with=RuntimeError("tool falhou"))
+            self.is_alive = alive
+            self.closed = False
 
-    async def fake_repo_exists(repo: str) -> bool:
-        return repo in {"golyzer", "cfi"}
+        async def close(self) -> None:
+            self.closed = True
 
-    monkeypatch.setattr(agent_mod, "_repo_exists", fake_repo_exists)
+    dummy = FailingBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
     async def run() -> None:
         agent = agent_mod.CodeCompassAgent()
@@ -444,26 +905,45 @@ def test_repo_command_rejects_csv_with_unknown_repo(
         session = await agent.new_session(cwd=".", mcpServers=[])
         response = await agent.prompt(
             acp.PromptRequest(
-                prompt=[acp.text_block("/repo golyzer,cfi,ui")],
+                prompt=[acp.text_block("Pergunta")],
                 session_id=session.session_id,
             )
         )
 
         assert response.stop_reason == "end_turn"
-        assert agent._sessions[session.session_id].repo_override is None
-        assert any("Repo 'ui' não existe." in text for _, text in conn.updates)
+        assert dummy.closed is expect_closed
 
     asyncio.run(run())
 
 
-def test_repo_command_keeps_single_repo_flow(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.parametrize(
+    ("existing", "command", "expected_override", "expected_message"),
+    [
+        (
+            {"golyzer", "cfi", "ui", "base"},
+            "/repo golyzer,cfi,ui,base",
+            "golyzer,cfi,ui,base",
+            "Repos atualizados para: golyzer,cfi,ui,base",
+        ),
+        ({"golyzer", "cfi"}, "/repo golyzer,cfi,ui", None, "Repo 'ui' não existe."),
+        ({"golyzer"}, "/repo golyzer", "golyzer", "Repo atualizado para: golyzer"),
+    ],
+    ids=["csv", "csv-with-unknown-repo", "single-repo"],
+)
+def test_repo_command(
+    monkeypatch: pytest.MonkeyPatch,
+    existing: set[str],
+    command: str,
+    expected_override: str | None,
+    expected_message: str,
+) -> None:
     from code_compass_acp import agent as agent_mod
 
     dummy = DummyBridge()
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
-    async def fake_repo_exists(repo: str) -> bool:
-        return repo == "golyzer"
+    async def fake_repo_exists(repo: str, codebase_root: str | None) -> bool:
+        return repo in existing
 
     monkeypatch.setattr(agent_mod, "_repo_exists", fake_repo_exists)
 
@@ -475,36 +955,90 @@ def test_repo_command_keeps_single_repo_flow(monkeypatch: pytest.MonkeyPatch) ->
         session = await agent.new_session(cwd=".", mcpServers=[])
         response = await agent.prompt(
             acp.PromptRequest(
-                prompt=[acp.text_block("/repo golyzer")],
+                prompt=[acp.text_block(command)],
                 session_id=session.session_id,
             )
         )
 
         assert response.stop_reason == "end_turn"
-        assert agent._sessions[session.session_id].repo_override == "golyzer"
-        assert any("Repo atualizado para: golyzer" in text for _, text in conn.updates)
+        assert agent._sessions[session.session_id].repo_override == expected_override
+        assert expected_message in _joined_text(conn)
+
+    asyncio.run(run())
+
+
+def test_repo_exists_caches_only_positive_results(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    root = str(tmp_path)
+    monkeypatch.setattr(agent_mod, "_existing_repo_cache", {})
+    (tmp_path / "golyzer").mkdir()
+
+    async def run() -> None:
+        assert await agent_mod._repo_exists("golyzer", root)
+        assert not await agent_mod._repo_exists("novo-repo", root)
+
+        (tmp_path / "novo-repo").mkdir()
+        (tmp_path / "golyzer").rmdir()
+
+        assert await agent_mod._repo_exists("novo-repo", root)
+        assert await agent_mod._repo_exists("golyzer", root)
+
+        monkeypatch.setattr(agent_mod, "REPO_EXISTS_CACHE_TTL_SECONDS", 0.0)
+        agent_mod._existing_repo_cache.clear()
+        assert await agent_mod._repo_exists("novo-repo", root)
+        (tmp_path / "novo-repo").rmdir()
+        assert not await agent_mod._repo_exists("novo-repo", root)
+
+    asyncio.run(run())
+
+
+def test_repo_exists_cache_evicts_oldest_entry(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    root = str(tmp_path)
+    monkeypatch.setattr(agent_mod, "_existing_repo_cache", {})
+    monkeypatch.setattr(agent_mod, "REPO_EXISTS_CACHE_MAX_SIZE", 2)
+    for name in ("repo-a", "repo-b", "repo-c"):
+        (tmp_path / name).mkdir()
+
+    async def run() -> None:
+        for name in ("repo-a", "repo-b", "repo-c"):
+            assert await agent_mod._repo_exists(name, root)
 
     asyncio.run(run())
 
+    assert list(agent_mod._existing_repo_cache) == [(root, "repo-b"), (root, "repo-c")]
+
+
+CONFIG_ENV = {
+    "ACP_REPO": "golyzer,cfi",
+    "LLM_MODEL": "gpt-5-mini",
+    "ACP_PATH_PREFIX": "apps/",
+    "ACP_LANGUAGE": "ts",
+    "ACP_TOPK": "15",
+    "ACP_MIN_SCORE": "0.62",
+    "ACP_GROUNDED": "true",
+    "ACP_KNOWLEDGE_MODE": "all",
+    "ACP_CONTENT_TYPE": "docs",
+    "ACP_STRICT": "yes",
+    "ACP_SHOW_META": "1",
+    "ACP_SHOW_CONTEXT": "on",
+    "CODEBASE_ROOT": "/tmp/code-base",
+}
+
 
 def test_config_command_reports_effective_payload(monkeypatch: pytest.MonkeyPatch) -> None:
     from code_compass_acp import agent as agent_mod
 
     dummy = DummyBridge()
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
-    monkeypatch.setenv("ACP_REPO", "golyzer,cfi")
-    monkeypatch.setenv("LLM_MODEL", "gpt-5-mini")
-    monkeypatch.setenv("ACP_PATH_PREFIX", "apps/")
-    monkeypatch.setenv("ACP_LANGUAGE", "ts")
-    monkeypatch.setenv("ACP_TOPK", "15")
-    monkeypatch.setenv("ACP_MIN_SCORE", "0.62")
-    monkeypatch.setenv("ACP_GROUNDED", "true")
-    monkeypatch.setenv("ACP_KNOWLEDGE_MODE", "all")
-    monkeypatch.setenv("ACP_CONTENT_TYPE", "docs")
-    monkeypatch.setenv("ACP_STRICT", "yes")
-    monkeypatch.setenv("ACP_SHOW_META", "1")
-    monkeypatch.setenv("ACP_SHOW_CONTEXT", "on")
-    monkeypatch.setenv("CODEBASE_ROOT", "/tmp/code-base")
+    for key, value in CONFIG_ENV.items():
+        monkeypatch.setenv(key, value)
 
     async def run() -> None:
         agent = agent_mod.CodeCompassAgent()
@@ -521,7 +1055,7 @@ def test_config_command_reports_effective_payload(monkeypatch: pytest.MonkeyPatc
 
         assert response.stop_reason == "end_turn"
         assert conn.updates
-        _, text = conn.updates[-1]
+        text = conn.updates[-1]
         payload = _extract_config_payload(text)
         assert payload["scope"] == {"type": "repos", "repos": ["golyzer", "cfi"]}
         assert payload["model"]["active"] == "gpt-5-mini"
@@ -560,7 +1094,7 @@ def test_config_command_reflects_runtime_overrides(monkeypatch: pytest.MonkeyPat
     dummy = DummyBridge()
     monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
 
-    async def fake_repo_exists(repo: str) -> bool:
+    async def fake_repo_exists(repo: str, codebase_root: str | None) -> bool:
         return repo == "base"
 
     monkeypatch.setattr(agent_mod, "_repo_exists", fake_repo_exists)
@@ -592,7 +1126,7 @@ def test_config_command_reflects_runtime_overrides(monkeypatch: pytest.MonkeyPat
         )
 
         assert response.stop_reason == "end_turn"
-        _, text = conn.updates[-1]
+        text = conn.updates[-1]
         payload = _extract_config_payload(text)
         assert payload["repo"]["active"] == "base"
         assert payload["repo"]["override"] == "base"
@@ -613,6 +1147,116 @@ def test_config_command_reflects_runtime_overrides(monkeypatch: pytest.MonkeyPat
     asyncio.run(run())
 
 
+def test_config_command_reports_memory_written_by_another_session(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    dummy = DummyBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_SESSION_BACKEND", "memory")
+    monkeypatch.setenv("ACP_MEMORY_DB_PATH", str(tmp_path / "memory.sqlite3"))
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        first = await agent.new_session(cwd=".", mcpServers=[])
+        second = await agent.new_session(cwd=".", mcpServers=[])
+        for session in (first, second):
+            await agent.set_config_option(
+                config_id="user.id", session_id=session.session_id, value="junior"
+            )
+            await agent.set_config_option(
+                config_id="user.tenant", session_id=session.session_id, value="acme"
+            )
+
+        async def send(session_id: str, text: str) -> str:
+            await agent.prompt(
+                acp.PromptRequest(prompt=[acp.text_block(text)], session_id=session_id)
+            )
+            return conn.updates[-1]
+
+        before = _extract_config_payload(await send(first.session_id, "/config"))
+        assert before["memoryHealth"]["preloadContextChars"] == 0
+
+        await send(second.session_id, "Meu nome é Junior")
+
+        after = _extract_config_payload(await send(first.session_id, "/config"))
+        assert after["memoryHealth"]["preloadContextChars"] > 0
+        assert after["memory"]["contextChars"] > 0
+
+    asyncio.run(run())
+
+
+def test_model_profiles_are_reparsed_only_when_file_changes(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    profiles_file = tmp_path / "model-profiles.toml"
+    profiles_file.write_text('[profiles.fast]\nmodel = "gpt-5-mini"\n', encoding="utf-8")
+    monkeypatch.setenv("ACP_MODEL_PROFILES_FILE", str(profiles_file))
+    monkeypatch.setattr(agent_mod, "_model_profiles_cache", None)
+    parses = 0
+    original = agent_mod._parse_model_profiles
+
+    def counting_parse(path: Path) -> Any:
+        nonlocal parses
+        parses += 1
+        return original(path)
+
+    monkeypatch.setattr(agent_mod, "_parse_model_profiles", counting_parse)
+
+    profiles, error = agent_mod._load_model_profiles()
+    assert error is None
+    assert profiles["fast"].model == "gpt-5-mini"
+    agent_mod._load_model_profiles()
+    assert parses == 1
+
+    profiles_file.write_text('[profiles.fast]\nmodel = "gpt-5-nano-x"\n', encoding="utf-8")
+    profiles, _ = agent_mod._load_model_profiles()
+    assert profiles["fast"].model == "gpt-5-nano-x"
+    assert parses == 2
+
+
+def test_model_command_keeps_bridge_when_settings_do_not_change(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    built: list[DummyBridge] = []
+
+    def fake_build_bridge(llm_model: str | None = None) -> DummyBridge:
+        bridge = DummyBridge()
+        built.append(bridge)
+        return bridge
+
+    monkeypatch.setattr(agent_mod, "build_bridge", fake_build_bridge)
+    monkeypatch.setenv("ACP_MODEL_PROFILES_FILE", "missing-profiles.toml")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+        for command in ("/model reset", "/model gpt-5", "/model gpt-5"):
+            await agent.prompt(
+                acp.PromptRequest(
+                    prompt=[acp.text_block(command)],
+                    session_id=session.session_id,
+                )
+            )
+
+        assert len(built) == 2
+        assert agent._sessions[session.session_id].mcp_bridge is built[-1]
+
+    asyncio.run(run())
+
+
 def test_model_command_uses_profile_from_toml(
     monkeypatch: pytest.MonkeyPatch,
     tmp_path: Path,
@@ -681,7 +1325,7 @@ def test_model_command_uses_profile_from_toml(
         assert state.llm_provider_override == "deepseek"
         assert state.llm_api_url_override == "https://api.deepseek.com"
         assert state.llm_api_key_override == "token-123"
-        assert any("Perfil 'deepseek' ativado:" in text for _, text in conn.updates)
+        assert "Perfil 'deepseek' ativado:" in _joined_text(conn)
 
         config_response = await agent.prompt(
             acp.PromptRequest(
@@ -690,7 +1334,7 @@ def test_model_command_uses_profile_from_toml(
             )
         )
         assert config_response.stop_reason == "end_turn"
-        _, config_text = conn.updates[-1]
+        config_text = conn.updates[-1]
         config_payload = _extract_config_payload(config_text)
         assert config_payload["model"]["active"] == "deepseek-reasoner"
         assert config_payload["model"]["profile"] == "deepseek"
@@ -736,7 +1380,7 @@ def test_model_command_reports_profile_loading_error(
         )
 
         assert response.stop_reason == "end_turn"
-        assert any("Falha ao carregar perfis de modelo." in text for _, text in conn.updates)
+        assert "Falha ao carregar perfis de modelo." in _joined_text(conn)
         state = agent._sessions[session.session_id]
         assert state.model_override is None
         assert state.model_profile_override is None
@@ -765,7 +1409,7 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
             )
         )
         assert show_response.stop_reason == "end_turn"
-        assert any("Grounded atual: off (fonte: env)." in text for _, text in conn.updates)
+        assert "Grounded atual: off (fonte: env)." in _joined_text(conn)
 
         on_response = await agent.prompt(
             acp.PromptRequest(
@@ -775,7 +1419,7 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
         )
         assert on_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].grounded_override is True
-        assert any("Grounded ativado para esta sessão." in text for _, text in conn.updates)
+        assert "Grounded ativado para esta sessão." in _joined_text(conn)
 
         config_on_response = await agent.prompt(
             acp.PromptRequest(
@@ -784,7 +1428,7 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
             )
         )
         assert config_on_response.stop_reason == "end_turn"
-        _, config_on_text = conn.updates[-1]
+        config_on_text = conn.updates[-1]
         config_on_payload = _extract_config_payload(config_on_text)
         assert config_on_payload["grounded"]["active"] is True
         assert config_on_payload["grounded"]["override"] is True
@@ -799,7 +1443,7 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
         )
         assert off_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].grounded_override is False
-        assert any("Grounded desativado para esta sessão." in text for _, text in conn.updates)
+        assert "Grounded desativado para esta sessão." in _joined_text(conn)
 
         config_off_response = await agent.prompt(
             acp.PromptRequest(
@@ -808,7 +1452,7 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
             )
         )
         assert config_off_response.stop_reason == "end_turn"
-        _, config_off_text = conn.updates[-1]
+        config_off_text = conn.updates[-1]
         config_off_payload = _extract_config_payload(config_off_text)
         assert config_off_payload["grounded"]["active"] is False
         assert config_off_payload["grounded"]["override"] is False
@@ -823,15 +1467,88 @@ def test_grounded_command_on_off_and_reset(monkeypatch: pytest.MonkeyPatch) -> N
         )
         assert reset_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].grounded_override is None
-        assert any(
-            "Grounded resetado para o valor do ambiente." in text
-            for _, text in conn.updates
-        )
+        assert "Grounded resetado para o valor do ambiente." in _joined_text(conn)
+
+    asyncio.run(run())
+
+
+def test_ask_payload_reflects_overrides_changed_between_turns(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    dummy = DummyBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_GROUNDED", "false")
+    monkeypatch.setenv("ACP_REPO", "code-compass")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        session = await agent.new_session(cwd=".", mcpServers=[])
+
+        for text in ("Pergunta 1", "/grounded on", "/repo golyzer", "Pergunta 2"):
+            response = await agent.prompt(
+                acp.PromptRequest(
+                    prompt=[acp.text_block(text)],
+                    session_id=session.session_id,
+                )
+            )
+            assert response.stop_reason == "end_turn"
+
+        assert len(dummy.calls) == 2
+        first_call, second_call = dummy.calls
+        assert first_call["scope"] == {"type": "repo", "repo": "code-compass"}
+        assert "grounded" not in first_call
+        assert second_call["scope"] == {"type": "repo", "repo": "golyzer"}
+        assert second_call["grounded"] is True
+
+    asyncio.run(run())
+
+
+def test_env_snapshot_is_frozen_per_session(monkeypatch: pytest.MonkeyPatch) -> None:
+    from code_compass_acp import agent as agent_mod
+
+    dummy = DummyBridge()
+    monkeypatch.setattr(agent_mod, "build_bridge", lambda llm_model=None: dummy)
+    monkeypatch.setenv("ACP_REPO", "code-compass")
+    monkeypatch.setenv("CODEBASE_ROOT", "/tmp/antigo")
+
+    async def run() -> None:
+        agent = agent_mod.CodeCompassAgent()
+        conn = DummyConn()
+        agent.on_connect(conn)  # type: ignore[arg-type]
+
+        first = await agent.new_session(cwd=".", mcpServers=[])
+
+        async def ask(session_id: str) -> None:
+            await agent.prompt(
+                acp.PromptRequest(prompt=[acp.text_block("Pergunta")], session_id=session_id)
+            )
+
+        await ask(first.session_id)
+        monkeypatch.setenv("ACP_REPO", "golyzer")
+        monkeypatch.setenv("ACP_TOPK", "7")
+        monkeypatch.setenv("CODEBASE_ROOT", "/tmp/novo")
+        await ask(first.session_id)
+        second = await agent.new_session(cwd=".", mcpServers=[])
+        await ask(second.session_id)
+
+        assert [call["scope"] for call in dummy.calls] == [
+            {"type": "repo", "repo": "code-compass"},
+            {"type": "repo", "repo": "code-compass"},
+            {"type": "repo", "repo": "golyzer"},
+        ]
+        assert "topK" not in dummy.calls[1]
+        assert dummy.calls[2]["topK"] == 7
+        assert agent._sessions[first.session_id].cfg.codebase_root == "/tmp/antigo"
+        assert agent._sessions[second.session_id].cfg.codebase_root == "/tmp/novo"
 
     asyncio.run(run())
 
 
-def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch) -> None:
     from code_compass_acp import agent as agent_mod
 
     dummy = DummyBridge()
@@ -852,7 +1569,7 @@ def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch)
             )
         )
         assert show_response.stop_reason == "end_turn"
-        assert any("knowledge atual: strict (fonte: env)." in text for _, text in conn.updates)
+        assert "knowledge atual: strict (fonte: env)." in _joined_text(conn)
 
         all_response = await agent.prompt(
             acp.PromptRequest(
@@ -862,7 +1579,7 @@ def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch)
         )
         assert all_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].knowledge_mode_override == "all"
-        assert any("knowledgeMode atualizado para: all" in text for _, text in conn.updates)
+        assert "knowledgeMode atualizado para: all" in _joined_text(conn)
 
         config_all_response = await agent.prompt(
             acp.PromptRequest(
@@ -871,7 +1588,7 @@ def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch)
             )
         )
         assert config_all_response.stop_reason == "end_turn"
-        _, config_all_text = conn.updates[-1]
+        config_all_text = conn.updates[-1]
         config_all_payload = _extract_config_payload(config_all_text)
         assert config_all_payload["knowledge"]["active"] == "all"
         assert config_all_payload["knowledge"]["override"] == "all"
@@ -887,7 +1604,7 @@ def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch)
         )
         assert strict_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].knowledge_mode_override == "strict"
-        assert any("knowledgeMode atualizado para: strict" in text for _, text in conn.updates)
+        assert "knowledgeMode atualizado para: strict" in _joined_text(conn)
 
         reset_response = await agent.prompt(
             acp.PromptRequest(
@@ -897,10 +1614,7 @@ def test_knowledge_command_strict_all_and_reset(monkeypatch: pytest.MonkeyPatch)
         )
         assert reset_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].knowledge_mode_override is None
-        assert any(
-            "knowledgeMode resetado para o valor do ambiente." in text
-            for _, text in conn.updates
-        )
+        assert "knowledgeMode resetado para o valor do ambiente." in _joined_text(conn)
 
     asyncio.run(run())
 
@@ -926,7 +1640,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
             )
         )
         assert show_response.stop_reason == "end_turn"
-        assert any("contentType atual: docs (fonte: env)." in text for _, text in conn.updates)
+        assert "contentType atual: docs (fonte: env)." in _joined_text(conn)
 
         set_response = await agent.prompt(
             acp.PromptRequest(
@@ -936,7 +1650,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
         )
         assert set_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].content_type_override == "code"
-        assert any("contentType atualizado para: code" in text for _, text in conn.updates)
+        assert "contentType atualizado para: code" in _joined_text(conn)
 
         config_set_response = await agent.prompt(
             acp.PromptRequest(
@@ -945,7 +1659,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
             )
         )
         assert config_set_response.stop_reason == "end_turn"
-        _, config_set_text = conn.updates[-1]
+        config_set_text = conn.updates[-1]
         config_set_payload = _extract_config_payload(config_set_text)
         assert config_set_payload["contentType"]["active"] == "code"
         assert config_set_payload["contentType"]["override"] == "code"
@@ -961,10 +1675,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
         )
         assert reset_response.stop_reason == "end_turn"
         assert agent._sessions[session.session_id].content_type_override is None
-        assert any(
-            "contentType resetado para o valor do ambiente." in text
-            for _, text in conn.updates
-        )
+        assert "contentType resetado para o valor do ambiente." in _joined_text(conn)
 
         config_reset_response = await agent.prompt(
             acp.PromptRequest(
@@ -973,7 +1684,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
             )
         )
         assert config_reset_response.stop_reason == "end_turn"
-        _, config_reset_text = conn.updates[-1]
+        config_reset_text = conn.updates[-1]
         config_reset_payload = _extract_config_payload(config_reset_text)
         assert config_reset_payload["contentType"]["active"] == "docs"
         assert config_reset_payload["contentType"]["override"] is None
@@ -988,10 +1699,7 @@ def test_content_type_command_set_show_and_reset(monkeypatch: pytest.MonkeyPatch
             )
         )
         assert invalid_response.stop_reason == "end_turn"
-        assert any(
-            "Valor inválido. Use /content-type code|docs|all|reset." in text
-            for _, text in conn.updates
-        )
+        assert "Valor inválido. Use /content-type code|docs|all|reset." in _joined_text(conn)
 
     asyncio.run(run())
 